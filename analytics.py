@@ -0,0 +1,302 @@
+from collections import Counter
+from dataclasses import dataclass, field
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+import emoji_matcher
+import links
+import preprocessor
+from profiling import profiled, stage
+import tokenizer
+
+# per-frame state (user index, summaries) lives as long as the frame does
+_frame_caches = {}
+# the app may compute several panels of a frame at once on a thread pool
+_cache_lock = threading.Lock()
+
+
+def frame_cache(df):
+    key = id(df)
+    with _cache_lock:
+        entry = _frame_caches.get(key)
+        if entry is None or entry[0]() is not df:
+            def forget(ref):
+                if _frame_caches.get(key, (None,))[0] is ref:
+                    del _frame_caches[key]
+
+            entry = (weakref.ref(df, forget), {})
+            _frame_caches[key] = entry
+    return entry[1]
+
+
+def cache_lock(cache, key):
+    # one lock per cached value, threads computing the same value wait for
+    # the first while different values are computed side by side
+    with _cache_lock:
+        return cache.setdefault(('lock', key), threading.Lock())
+
+
+# row positions of every user, built once per frame instead of a full
+# df['user'] == selected_user comparison in every helper
+def user_index(df):
+    cache = frame_cache(df)
+    if 'user_index' not in cache:
+        cache['user_index'] = df.groupby('user', sort=False).indices
+    return cache['user_index']
+
+
+def user_rows(selected_user, df):
+    if selected_user == 'Overall':
+        return df
+    positions = user_index(df).get(selected_user)
+    if positions is None:
+        return df.iloc[0:0]
+    return df.iloc[positions]
+
+
+# date and user of the messages in time order without notifications, what the
+# reply and session analytics walk
+def conversation(df):
+    cache = frame_cache(df)
+    with cache_lock(cache, 'conversation'):
+        if 'conversation' not in cache:
+            rows = df.loc[(df['user'] != 'group_notification') & df['date'].notna(), ['date', 'user']]
+            if not rows['date'].is_monotonic_increasing:
+                rows = rows.sort_values('date', kind='stable')
+            cache['conversation'] = rows.reset_index(drop=True)
+    return cache['conversation']
+
+
+# groups of summary fields computed together, a panel only pays for the ones it reads
+SUMMARY_PARTS = ('counts', 'links', 'words', 'emojis', 'buckets')
+
+
+@dataclass
+class ChatSummary:
+    num_messages: int = 0
+    num_words: int = 0
+    num_media_messages: int = 0
+    num_links: int = 0
+    # lowercased, stop-word filtered words of text messages, in first-seen order
+    word_counts: Counter = field(default_factory=Counter)
+    emoji_counts: Counter = field(default_factory=Counter)
+    # message count per (only_date, hour) with the calendar columns the panels group by
+    time_buckets: pd.DataFrame = None
+    # SUMMARY_PARTS filled in so far
+    parts: set = field(default_factory=set)
+
+
+def chat_tokens(df):
+    # the whole chat is tokenized once, users and panels take slices of it
+    cache = frame_cache(df)
+    with cache_lock(cache, 'tokens'):
+        if 'tokens' not in cache:
+            cache['tokens'] = tokenizer.tokenize_messages(df['user'], df['message'])
+    return cache['tokens']
+
+
+def user_token_ids(selected_user, df):
+    stream = chat_tokens(df)
+    if selected_user == 'Overall':
+        return stream.ids
+    positions = user_index(df).get(selected_user)
+    if positions is None:
+        return stream.ids[:0]
+    return tokenizer.select_rows(stream, positions)
+
+
+@profiled
+def bucket_counts(df):
+    buckets = df.groupby(['only_date', 'hour']).size().reset_index(name='count')
+    dates = pd.to_datetime(buckets['only_date'])
+    buckets['year'] = dates.dt.year
+    buckets['month_num'] = dates.dt.month
+    buckets['month'] = dates.dt.month_name()
+    buckets['day_name'] = dates.dt.day_name()
+    buckets['period'] = preprocessor.PERIODS[buckets['hour'].to_numpy(dtype=int)]
+    return buckets
+
+
+@profiled
+def summarize_part(summary, part, selected_user, df):
+    rows = user_rows(selected_user, df)
+    if part == 'counts':
+        summary.num_messages = rows.shape[0]
+        # one walk over the messages for both counters
+        with stage('count_words'):
+            for message in rows['message']:
+                summary.num_words += len(message.split())
+                if '<Media omitted>' in message:
+                    summary.num_media_messages += 1
+    elif part == 'links':
+        # the whole chat shares its per-message counts with the leaderboard and
+        # the time index, one user only scans their own messages unless the
+        # counts of the chat are already there
+        if selected_user == 'Overall' or 'message_counts' in frame_cache(df):
+            link_counts = message_counts(df)['links'].to_numpy()
+            if selected_user != 'Overall':
+                link_counts = link_counts[user_index(df).get(selected_user, np.array([], dtype=np.intp))]
+            summary.num_links = int(link_counts.sum())
+        else:
+            summary.num_links = links.count_links(rows['message'])
+    elif part == 'words':
+        summary.word_counts = tokenizer.word_counts(chat_tokens(df), user_token_ids(selected_user, df))
+    elif part == 'emojis':
+        summary.emoji_counts = emoji_matcher.count_emojis(rows['message'])
+    elif part == 'buckets':
+        summary.time_buckets = bucket_counts(rows)
+    summary.parts.add(part)
+
+
+def summarize(selected_user, df, parts=SUMMARY_PARTS):
+    summary = ChatSummary()
+    for part in parts:
+        summarize_part(summary, part, selected_user, df)
+    return summary
+
+
+def merge_buckets(first, second):
+    keys = ['only_date', 'hour', 'year', 'month_num', 'month', 'day_name', 'period']
+    return pd.concat([first, second]).groupby(keys)['count'].sum().reset_index()
+
+
+def combine(first, second):
+    # summary of two consecutive runs of messages, for the parts both have
+    summary = ChatSummary(parts=first.parts & second.parts)
+    if 'counts' in summary.parts:
+        summary.num_messages = first.num_messages + second.num_messages
+        summary.num_words = first.num_words + second.num_words
+        summary.num_media_messages = first.num_media_messages + second.num_media_messages
+    if 'links' in summary.parts:
+        summary.num_links = first.num_links + second.num_links
+    if 'words' in summary.parts:
+        summary.word_counts = first.word_counts + second.word_counts
+    if 'emojis' in summary.parts:
+        summary.emoji_counts = first.emoji_counts + second.emoji_counts
+    if 'buckets' in summary.parts:
+        summary.time_buckets = merge_buckets(first.time_buckets, second.time_buckets)
+    return summary
+
+
+def extend_frame(old_df, df, tail):
+    # df is old_df followed by the tail rows, carry over whatever was already
+    # computed for old_df and only work through the tail
+    old_cache = frame_cache(old_df)
+    cache = frame_cache(df)
+    offset = old_df.shape[0]
+
+    if 'user_index' in old_cache:
+        index = dict(old_cache['user_index'])
+        for user, positions in tail.groupby('user', sort=False).indices.items():
+            positions = positions + offset
+            index[user] = np.concatenate([index[user], positions]) if user in index else positions
+        cache['user_index'] = index
+
+    if 'tokens' in old_cache:
+        cache['tokens'] = tokenizer.extend_stream(old_cache['tokens'], tail['user'], tail['message'])
+
+    if 'message_counts' in old_cache:
+        counts = pd.concat([old_cache['message_counts'], message_counts(tail)], ignore_index=True)
+        cache['message_counts'] = counts.set_axis(df.index)
+
+    for key, summary in list(old_cache.items()):
+        if isinstance(key, tuple) and key[0] == 'summary':
+            cache[key] = combine(summary, summarize(key[1], tail, summary.parts))
+
+
+def chat_summary(selected_user, df, *parts):
+    # memoized per frame and user, every dashboard panel reads from it; only
+    # the given parts (all by default) are computed if still missing
+    cache = frame_cache(df)
+    key = ('summary', selected_user)
+    with _cache_lock:
+        summary = cache.setdefault(key, ChatSummary())
+    for part in parts or SUMMARY_PARTS:
+        # a part is filled in place, no other thread may see it half done
+        with cache_lock(cache, (key, part)):
+            if part not in summary.parts:
+                summarize_part(summary, part, selected_user, df)
+    return summary
+
+
+# per-message counts the range totals, the leaderboard and the links summary
+# add up, one row per df row
+@profiled
+def message_counts(df):
+    cache = frame_cache(df)
+    with cache_lock(cache, 'message_counts'):
+        if 'message_counts' not in cache:
+            messages = df['message']
+            cache['message_counts'] = pd.DataFrame({
+                # one message split at a time, not a token list for every row at once
+                'words': pd.Series([len(message.split()) for message in messages], index=df.index, dtype='int64'),
+                'media': messages.str.contains('<Media omitted>', regex=False),
+                'links': links.link_counts(messages).reindex(df.index, fill_value=0),
+            }, index=df.index)
+    return cache['message_counts']
+
+
+@dataclass
+class TimeIndex:
+    # timestamps of the dated messages in ascending order
+    dates: np.ndarray
+    # running totals over those messages, entry i covers the first i of them
+    cumulative: dict
+    # days with messages in ascending order and the running message count
+    # before each, entry i covers the first i days
+    days: np.ndarray
+    day_cumulative: np.ndarray
+
+
+@profiled
+def time_index(selected_user, df):
+    # built once per frame and user, any date range is then two binary
+    # searches and a difference of running totals instead of a rescan
+    cache = frame_cache(df)
+    key = ('time_index', selected_user)
+    with cache_lock(cache, key):
+        if key not in cache:
+            if selected_user == 'Overall':
+                positions = np.arange(df.shape[0])
+            else:
+                positions = user_index(df).get(selected_user, np.array([], dtype=np.intp))
+            dates = df['date'].to_numpy()[positions]
+            dated = ~np.isnat(dates)
+            positions, dates = positions[dated], dates[dated]
+            order = np.argsort(dates, kind='stable')
+            positions, dates = positions[order], dates[order]
+
+            counts = message_counts(df)
+            cumulative = {}
+            for name in ('words', 'media', 'links'):
+                running = np.cumsum(counts[name].to_numpy()[positions], dtype=np.int64)
+                cumulative[name] = np.concatenate([[0], running])
+            days, per_day = np.unique(dates.astype('datetime64[D]'), return_counts=True)
+            day_cumulative = np.concatenate([[0], np.cumsum(per_day, dtype=np.int64)])
+            cache[key] = TimeIndex(dates, cumulative, days, day_cumulative)
+    return cache[key]
+
+
+def day_span(start, end):
+    # the inclusive date range as [first day, day after the last)
+    return np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1
+
+
+def range_totals(selected_user, df, start, end):
+    index = time_index(selected_user, df)
+    first, stop = day_span(start, end)
+    lo, hi = np.searchsorted(index.dates, np.array([first, stop]).astype(index.dates.dtype))
+    totals = {'messages': int(hi - lo)}
+    for name, running in index.cumulative.items():
+        totals[name] = int(running[hi] - running[lo])
+    return totals
+
+
+def range_days(selected_user, df, start, end):
+    # the days with messages between start and end and their message counts
+    index = time_index(selected_user, df)
+    lo, hi = np.searchsorted(index.days, np.array(day_span(start, end)))
+    return index.days[lo:hi], np.diff(index.day_cumulative[lo:hi + 1])
@@ -1,7 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+import contextvars
+import json
+import threading
+import zipfile
+
+import pandas as pd
 import streamlit as st
-import preprocessor, helper
-import matplotlib.pyplot as plt
-import seaborn as sns
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import helper, analytics, chat_cache, chat_store, charts, profiling
 
 # Streamlit Page Configuration
 st.set_page_config(
@@ -66,522 +73,601 @@ st.markdown(
 )
 
 
-# Sidebar
-st.sidebar.title("📊 WhatsApp Chat Analyzer")
-uploaded_file = st.sidebar.file_uploader("Choose a file")
+# Streamlit reruns the whole script on every widget change, so the parsed chat
+# and every helper result are memoized by chat content hash and selected user
+@st.cache_resource(max_entries=2, show_spinner="Reading chat...")
+def load_chat(chat_key, _uploaded_file):
+    # a zipped export with media is streamed, only its chat text is decoded;
+    # the hash of that text comes back with the frame for the chat store
+    text_key, df = chat_cache.preprocess_upload(_uploaded_file)
+    # build the per-user row index once, the helpers reuse it
+    analytics.user_index(df)
+    return text_key, df
 
-if uploaded_file is not None:
-    bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
-    df = preprocessor.preprocess(data)
 
-    # Fetch unique users
-    user_list = df['user'].unique().tolist()
+@st.cache_data(max_entries=4, show_spinner=False)
+def fetch_user_list(chat_key, _df):
+    user_list = _df['user'].unique().tolist()
     if 'group_notification' in user_list:
         user_list.remove('group_notification')
     user_list.sort()
     user_list.insert(0, "Overall")
+    return user_list
 
-    selected_user = st.sidebar.selectbox("Show analysis wrt", user_list)
-
-    if st.sidebar.button("Show Analysis"):
-        # Display statistics
-        num_messages, words, num_media_messages, num_links = helper.fetch_stats(selected_user, df)
-        # Title with Text Border
-        st.markdown(
-            """
-            <h1 style='color: white; -webkit-text-stroke: 1px black; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); font-size: 2.2em;'>
-                📈 Top Statistics
-            </h1>
-            """,
-            unsafe_allow_html=True,
-        )
-        col1, col2, col3, col4 = st.columns(4)
-
-        with col1:
-            st.markdown(
-                f"""
-                <div style='text-align: center; background-color: #FAF3E0; padding: 10px; border-radius: 10px'>
-                    <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Total Messages</h1>
-                    <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{num_messages}</h1>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        with col2:
-            st.markdown(
-                f"""
-                <div style='text-align: center; background-color: #FFE3E0; padding: 10px; border-radius: 10px; margin-top: 10px;'>
-                    <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Total Words</h1>
-                    <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{words}</h1>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        with col3:
-            st.markdown(
-                f"""
-                <div style='text-align: center; background-color: #f0f5ff; padding: 10px; border-radius: 10px; margin-top: 10px;'>
-                    <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Media Shared</h1>
-                    <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{num_media_messages}</h1>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-        with col4:
-            st.markdown(
-                f"""
-                <div style='text-align: center; background-color: #fff0fc; padding: 10px; border-radius: 10px; margin-top: 10px;'>
-                    <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Links Shared</h1>
-                    <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{num_links}</h1>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Monthly timeline
-        # Title with Text Border
-        st.markdown(
-            """
-            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em; text-align: left;'>
-                📅 Monthly Timeline
-            </h1>
-            """,
-            unsafe_allow_html=True,
-        )
-
-        timeline = helper.monthly_timeline(selected_user, df)
-        # Create a plot with a customized background
-        fig, ax = plt.subplots(figsize=(10, 6))
-
-        # Change the background color of the plot
-        ax.set_facecolor('#2E2E2E')  # Dark background for the plot
-        fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
-
-        # Plot the timeline data with custom color
-        ax.plot(timeline['time'], timeline['message'], color='red', linewidth=2)
-
-        # Add gridlines with a different color
-        ax.grid(True, color='white', linestyle='--', linewidth=0.5)
-
-        # Customize x-axis labels (rotate them for better visibility)
-        plt.xticks(rotation='vertical', color='white', fontsize=12)
-
-        # Customize y-axis labels and set the color to white
-        plt.yticks(color='white', fontsize=12)
-
-        plt.title(" ") #to make gap in top
-
-        # Add y-axis and x-axis labels (optional)
-        ax.set_xlabel('Time', fontsize=14, color='white', labelpad=15)
-        ax.set_ylabel('Messages', fontsize=14, color='white', labelpad=15)
-
-        # Adjust layout to avoid clipping
-        plt.tight_layout()
-
-        # Show the plot in the Streamlit app
-        st.pyplot(fig)
-
-        # Daily timeline
-        # Title with Text Border
-        st.markdown(
-            """
-            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em;'>
-                📅 Daily Timeline
-            </h1>
-            """,
-            unsafe_allow_html=True,
-        )
-        # Create the daily timeline plot with a customized background
-        daily_timeline = helper.daily_timeline(selected_user, df)
-        fig, ax = plt.subplots(figsize=(10, 6))
-
-        # Change the background color of the plot
-        ax.set_facecolor('#2E2E2E')  # Dark background for the plot
-        fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
-
-        # Plot the daily timeline data with a custom color
-        ax.plot(daily_timeline['only_date'], daily_timeline['message'], color='green', linewidth=2)
-
-        # Add gridlines with a different color
-        ax.grid(True, color='white', linestyle='--', linewidth=0.5)
-
-        # Customize x-axis labels (rotate them for better visibility) and set the color to white
-        plt.xticks(rotation='vertical', color='white', fontsize=12)
-
-        # Customize y-axis labels and set the color to white
-        plt.yticks(color='white', fontsize=12)
-
-        # Add x-axis and y-axis labels (optional)
-        ax.set_xlabel('Date', fontsize=14, color='white', labelpad=20)
-        ax.set_ylabel('Messages', fontsize=14, color='white', labelpad=18)
-
-        # Title
-        plt.title(" ")
-
-        # Adjust layout to avoid clipping
-        plt.tight_layout()
-
-        # Show the plot in the Streamlit app
-        st.pyplot(fig)
-
-        # Activity Map
-        # Title with Text Border
-        st.markdown(
-            """
-            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2.1em;'>
-                🗺️ Activity Map
-            </h1>
-            """,
-            unsafe_allow_html=True,
-        )
-        col1, col2 = st.columns(2)
-
-        # Most Busy Day
-        with col1:
-            # Use custom HTML for header styling
-            st.markdown(
-                """
-                <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
-                    Most Busy Day
-                </h2>
-                """, unsafe_allow_html=True
-            )
-            # Get the busy day data
-            busy_day = helper.week_activity_map(selected_user, df)
-
-            # Create the figure and axis for the plot
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            # Set background color for the plot
-            ax.set_facecolor('#2E2E2E')  # Dark background for the plot
-            fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
-
-            # Bar plot for busy day
-            ax.bar(busy_day.index, busy_day.values, color='purple', edgecolor='black', linewidth=1.5)
-
-            # Customize x-axis labels and rotate them
-            plt.xticks(rotation='vertical', color='white', fontsize=12)
-
-            # Customize y-axis labels
-            plt.yticks(color='white', fontsize=12)
-
-            plt.title(" ")
-
-            # Set axis labels with padding
-            ax.set_xlabel('Day of the Week', fontsize=14, color='white', labelpad=15)
-            ax.set_ylabel('Number of Messages', fontsize=14, color='white', labelpad=15)
-
-            # Add gridlines with a lighter color and dashed lines for style
-            ax.grid(True, color='white', linestyle='--', linewidth=0.5)
-
-            # Adjust layout to avoid clipping
-            plt.tight_layout()
-
-            # Display the plot in Streamlit
-            st.pyplot(fig)
-
-        # Most Busy Month
-        with col2:
-            # Use custom HTML for header styling
-            st.markdown(
-                """
-                <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
-                    Most Busy Month
-                </h2>
-                """, unsafe_allow_html=True
-            )
-            # Get the busy month data
-            busy_month = helper.month_activity_map(selected_user, df)
-
-            # Create the figure and axis for the plot
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            # Set background color for the plot
-            ax.set_facecolor('#2E2E2E')  # Dark background for the plot
-            fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
-
-            # Bar plot for busy month
-            ax.bar(busy_month.index, busy_month.values, color='orange', edgecolor='black', linewidth=1.5)
-
-            # Customize x-axis labels and rotate them
-            plt.xticks(rotation='vertical', color='white', fontsize=12)
-
-            # Customize y-axis labels
-            plt.yticks(color='white', fontsize=12)
-
-            # Set axis labels with padding
-            ax.set_xlabel('Month', fontsize=14, color='white', labelpad=15)
-            ax.set_ylabel('Number of Messages', fontsize=14, color='white', labelpad=15)
-
-            plt.title(" ")
-
-            # Add gridlines with a lighter color and dashed lines for style
-            ax.grid(True, color='white', linestyle='--', linewidth=0.5)
-
-            # Adjust layout to avoid clipping
-            plt.tight_layout()
-
-            # Display the plot in Streamlit
-            st.pyplot(fig)
-
-        # Heatmap
-        # Title with Text Border
-        st.markdown(
-            """
-            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 1.7em;'>
-                📅 Weekly Activity Map
-            </h1>
-            """,
-            unsafe_allow_html=True,
-        )
-
-        user_heatmap = helper.activity_heatmap(selected_user, df)
-
-        # Create the figure and axis for the plot
-        fig, ax = plt.subplots()
-
-        # Set the background color for the plot and figure to a lighter shade
-        ax.set_facecolor('#2E2E2E')  # Light background for the plot
-        fig.patch.set_facecolor('#1C1C1C')  # Light background for the figure
-
-        # Create the heatmap without annotations and customize the color bar
-        ax = sns.heatmap(
-            user_heatmap,
-            cmap='YlGnBu',
-            cbar_kws={
-                'shrink': 0.8,
-                'ticks': [0, 50, 100, 150, 200, 250, 300],  # Adjust tick range as per your data
-                'format': "%.0f"  # Format ticks as integers
-            },
-            annot=False  # Remove numbers inside the heatmap
-        )
-
-        # Customize the color bar appearance
-        cbar = ax.collections[0].colorbar
-        cbar.ax.tick_params(colors='white')  # Change color bar tick labels to black
-        cbar.ax.yaxis.label.set_color('white')  # Change color of the color bar label (if any)
-
-        # Customize x-axis labels and rotate them
-        plt.xticks(rotation='vertical', color='white', fontsize=8)
-
-        # Customize y-axis labels
-        plt.yticks(color='white', fontsize=12)
-
-        # Set axis labels with padding
-        ax.set_xlabel('Month', fontsize=10, color='white', labelpad=15)
-        ax.set_ylabel('Number of Messages', fontsize=10, color='white')
-
-        plt.title(" ")
-
-        # Display the plot in Streamlit
-        st.pyplot(fig)
-
-        # Busiest Users
-        if selected_user == 'Overall':
-            # Title with subtle styling
-            st.markdown(
-                """
-                <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em;'>
-                    👥 Most Busy Users
-                </h1>
-                """,
-                unsafe_allow_html=True,
-            )
-
-            # Get data for busiest users
-            x, new_df = helper.most_busy_users(df)
-
-            # Format column 2 to display only 2 decimal places
-            new_df.iloc[:, 1] = new_df.iloc[:, 1].apply(lambda x: f"{x:.2f}")
-
-            fig, ax = plt.subplots()
-
-            # Split the layout into two columns
-            col1, col2 = st.columns(2)
-
-            with col1:
-                # Customize the bar plot with minimal styling
-                ax.bar(
-                    x.index, x.values,
-                    color=['#FF6F61', '#FFA07A', '#FA8072', '#E9967A', '#FF4500'],
-                    edgecolor='black',
-                    linewidth=1
-                )
 
-                # Rotate x-axis labels for better readability
-                plt.xticks(rotation='vertical', fontsize=10, color='black')
-                plt.yticks(fontsize=10, color='black')
-
-                # Add title and labels with slight padding
-                plt.title(" ")
-                ax.set_xlabel('Users', fontsize=12, labelpad=10)
-                ax.set_ylabel('Message Count', fontsize=12, labelpad=10)
-
-                # Set light grey background for the plot
-                ax.set_facecolor('#F9F9F9')
-                fig.patch.set_facecolor('#FFFFFF')
-
-                # Display the plot
-                st.pyplot(fig)
-
-                # Rename the columns in new_df
-                new_df.columns = ['Name', 'Count']
-            with col2:
-                # Style the DataFrame for a cleaner look
-                styled_df = new_df.style.set_properties(**{
-                    'background-color': '#FFFFFF',
-                    'color': '#333333',
-                    'border-color': '#DDDDDD',
-                    'font-size': '14px',
-                    'padding': '5px',
-                })
-                st.dataframe(styled_df)
-
-        # WordCloud
-        # Add a styled title for better visual appeal
-        st.markdown(
-            """
-            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px #3498DB; font-size: 2.7em;'>
-                ☁️ WordCloud
-            </h1>
-            """,
-            unsafe_allow_html=True,
-        )
+@st.cache_data(max_entries=4, show_spinner=False)
+def fetch_date_bounds(chat_key, _df):
+    dates = _df['only_date'].dropna()
+    if dates.empty:
+        return None
+    return dates.min(), dates.max()
 
-        try:
-            # Generate the WordCloud
-            df_wc = helper.create_wordcloud(selected_user, df)
-
-            # Create the figure and axis for displaying the WordCloud
-            fig, ax = plt.subplots(figsize=(8, 6))  # Adjust size for better visibility
-            ax.imshow(df_wc, interpolation='bilinear')
-            ax.axis('off')  # Turn off axis to focus on the WordCloud
-            fig.patch.set_facecolor('#F0F8FF')  # Light blue background for the figure
-
-            # Display the WordCloud
-            st.pyplot(fig)
-        except ValueError:
-            # Display an error message if WordCloud generation fails
-            st.error(
-                """
-                <h3 style='color: #E74C3C; text-align: center;'>
-                    Not enough data to generate a WordCloud. Please select another user or overall.
-                </h3>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Most Common Words
-        st.markdown(
-            """
-            <h1 style='color: #FFFFFF; -webkit-text-stroke: 1px black; font-size: 2.5em; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); text-align: center;'>
-                📝 Most Common <br> Words
-            </h1>
-            """,
-            unsafe_allow_html=True
-        )
-
-        most_common_df = helper.most_common_words(selected_user, df)
-
-        if most_common_df.empty:
-            st.error("No words found for this user.")
-        else:
-            # Create figure and axis for the plot
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            # Create a horizontal bar plot with a cool color palette
-            bars = ax.barh(most_common_df[0], most_common_df[1], color='lightblue', edgecolor='black')
-
-            # Add value labels on bars for clarity
-            for bar in bars:
-                width = bar.get_width()
-                ax.text(
-                    width + 0.8,
-                    bar.get_y() + bar.get_height() / 2,
-                    f'{width:.0f}',
-                    va='center',
-                    fontsize=12,
-                    color='black'
-                )
 
-            # Set x-axis label and y-axis label with styling
-            ax.set_xlabel('Frequency', fontsize=14, color='black', labelpad=15)
-            ax.set_ylabel('Words', fontsize=14, color='black', labelpad=15)
-            plt.title(" ")
+@st.cache_data(max_entries=256, show_spinner=False)
+def analyze(name, chat_key, selected_user, _df, date_range=None, **options):
+    if name in ('most_busy_users', 'user_leaderboard'):
+        return getattr(helper, name)(_df)
+    if date_range is not None:
+        options['date_range'] = date_range
+    return getattr(helper, name)(selected_user, _df, **options)
 
-            # Set a soft gradient background for the plot
-            ax.set_facecolor('#F0F8FF')  # Light blue color for the plot background
 
-            # Customize the background of the figure
-            fig.patch.set_facecolor('#fbaed2')  # Sky blue color for the figure background
+# finished charts as PNG bytes, a revisit of a chat and user never touches
+# matplotlib, least recently used images beyond CHART_CACHE_ENTRIES are dropped
+CHART_CACHE_ENTRIES = 128
 
-            # Customize x-ticks and y-ticks
-            plt.xticks(rotation='vertical', fontsize=12, color='black')
-            plt.yticks(fontsize=15, color='black')
 
-            # Display the plot in Streamlit
-            st.pyplot(fig)
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)
+def chart_png(name, chat_key, selected_user, _df, date_range=None, **options):
+    data = analyze(name, chat_key, selected_user, _df, date_range, **options)
+    # pyplot keeps the current figure in global state, charts are drawn one at a time
+    with charts.draw_lock:
+        return charts.render_png(getattr(charts, name)(data))
 
-        # Emoji Analysis
-        st.markdown(
-            """
-            <h1 style='color: #FFFFFF; -webkit-text-stroke: 1px black; font-size: 2.2em; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5)'>
-                😊 Emoji Analysis
-            </h1>
-            """,
-            unsafe_allow_html=True
-        )
 
-        # Get emoji data
-        emoji_df = helper.emoji_helper(selected_user, df)
+@st.cache_resource
+def section_pool():
+    # shared by every session, pandas and numpy release the GIL for much of the work
+    return ThreadPoolExecutor(thread_name_prefix='section')
 
-        if emoji_df.empty:
-            st.error("Not enough data for emoji analysis.")
-        else:
-            # Rename the columns in emoji_df
-            emoji_df.columns = ['Emoji', 'Count']
-            # Split the layout into two columns
-            col1, col2 = st.columns(2)
-
-            # Column 1: Display DataFrame
-            with col1:
-
-                # Adjust the table dimensions and styling
-                styled_emoji_df = emoji_df.style.set_properties(
-                    **{
-                        'background-color': '#1E1E1E',  # Dark background for cells
-                        'color': 'white',  # White text
-                        'border-color': '#555555',  # Subtle border color
-                        'border-width': '1px',
-                        'border-style': 'solid',
-                        'font-size': '16px',  # Larger font size
-                        'padding': '10px',  # Padding for better spacing
-                    }
-                ).highlight_max(axis=0, color='#FFD700')  # Highlight max values in yellow
-
-                # Use Streamlit's styling to increase table size
+
+class SectionRunner:
+    # with a pool, every section's computation is submitted as the script
+    # reaches it and the section leaves a placeholder that is filled as soon as
+    # its result is ready, so the slowest section sets the wait; without one,
+    # sections are computed and drawn in order
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.ctx = get_script_run_ctx()
+        self.pending = {}
+
+    def run(self, compute):
+        # the cached functions look up the script run they belong to
+        add_script_run_ctx(threading.current_thread(), self.ctx)
+        return compute()
+
+    def show(self, compute, fill):
+        if self.pool is None:
+            fill(compute())
+            return
+        slot = st.empty()
+        slot.caption("Computing...")
+        # the pool thread runs in a copy of this context, so its stages reach
+        # the recorder of this run
+        context = contextvars.copy_context()
+        self.pending[self.pool.submit(context.run, self.run, compute)] = (slot, fill)
+
+    def image(self, compute):
+        self.show(compute, lambda png: st.image(png, width='stretch'))
+
+    def finish(self):
+        for future in as_completed(self.pending):
+            slot, fill = self.pending.pop(future)
+            with slot.container():
+                fill(future.result())
+
+
+# Sidebar
+st.sidebar.title("📊 WhatsApp Chat Analyzer")
+uploaded_file = st.sidebar.file_uploader("Choose a file", help="A .txt chat export, or the .zip of an export with media")
+# per-stage wall time, CPU time and peak memory of this rerun, off by default
+# since tracing every allocation slows the analysis down
+diagnostics = st.sidebar.checkbox("Diagnostics")
+
+# compute the sections of the page side by side on a thread pool
+concurrent = st.sidebar.checkbox("Concurrent sections", help="Sections are filled in as their results are ready")
+
+# tracemalloc has one peak counter for the process, sections running side by
+# side would count each other's allocations, so memory is only traced in order
+if diagnostics:
+    profiling.start_recording(trace_memory=not concurrent)
+else:
+    profiling.stop_recording()
+
+# the recorder is stopped however the run ends, st.stop and reruns included,
+# so memory tracing never outlives the run that asked for it
+try:
+    if uploaded_file is not None:
+        # parsed chats are also cached on disk by content hash
+        try:
+            chat_key = chat_cache.upload_key(uploaded_file)
+            text_key, df = load_chat(chat_key, uploaded_file)
+        except (UnicodeDecodeError, ValueError, zipfile.BadZipFile) as e:
+            st.error(f"Could not read this chat export: {e}")
+            st.stop()
+
+        # Fetch unique users
+        user_list = fetch_user_list(chat_key, df)
+
+        selected_user = st.sidebar.selectbox("Show analysis wrt", user_list)
+
+        # the top statistics and timelines can be narrowed to a date range, the
+        # whole chat is None so the full results keep coming from the summary
+        date_range = None
+        bounds = fetch_date_bounds(chat_key, df)
+        if bounds is not None and bounds[0] < bounds[1]:
+            chosen = st.sidebar.slider("Date range", min_value=bounds[0], max_value=bounds[1], value=bounds,
+                                       format="DD/MM/YY")
+            if chosen != bounds:
+                date_range = chosen
+
+        # the button reads True only on the run of the click, remember what it was
+        # clicked for so switching tabs keeps the analysis on screen
+        if st.sidebar.button("Show Analysis"):
+            st.session_state['analysis'] = (chat_key, selected_user)
+
+        # kept in the local chat store, where helper functions can query it
+        # together with every other stored chat
+        if st.sidebar.button("Add to chat store"):
+            with closing(chat_store.connect()) as conn:
+                chat_store.ingest(conn, text_key, uploaded_file.name, df)
+                stored = conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+            st.sidebar.success(f"Saved, {stored} chats in {chat_store.STORE_PATH}")
+
+        if st.session_state.get('analysis') == (chat_key, selected_user):
+            runner = SectionRunner(section_pool() if concurrent else None)
+
+            # Display statistics
+            with profiling.stage('chart: top statistics'):
+                # Title with Text Border
                 st.markdown(
                     """
-                    <style>
-                    .dataframe tbody tr th {
-                        font-size: 18px;  /* Larger font size for row headers */
-                    }
-                    .dataframe tbody tr td {
-                        font-size: 16px;  /* Larger font size for cell values */
-                    }
-                    .dataframe {
-                        margin: 20px auto;  /* Center align table */
-                        width: 95%;  /* Make the table wider */
-                        background-color: #2E2E2E; /* Match background to table */
-                        border-radius: 10px; /* Rounded edges */
-                        overflow: hidden; /* Keep table clean */
-                    }
-                    </style>
+                    <h1 style='color: white; -webkit-text-stroke: 1px black; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); font-size: 2.2em;'>
+                        📈 Top Statistics
+                    </h1>
                     """,
                     unsafe_allow_html=True,
                 )
-                # Display the styled DataFrame
-                st.dataframe(styled_emoji_df, use_container_width=True)
+                if date_range is not None:
+                    st.caption(f"{date_range[0]:%d %b %Y} to {date_range[1]:%d %b %Y}, "
+                               "the top statistics and timelines cover this range only")
+                def top_statistics(stats):
+                    num_messages, words, num_media_messages, num_links = stats
+                    col1, col2, col3, col4 = st.columns(4)
+
+                    with col1:
+                        st.markdown(
+                            f"""
+                            <div style='text-align: center; background-color: #FAF3E0; padding: 10px; border-radius: 10px'>
+                                <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Total Messages</h1>
+                                <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{num_messages}</h1>
+                            </div>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+                    with col2:
+                        st.markdown(
+                            f"""
+                            <div style='text-align: center; background-color: #FFE3E0; padding: 10px; border-radius: 10px; margin-top: 10px;'>
+                                <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Total Words</h1>
+                                <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{words}</h1>
+                            </div>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+                    with col3:
+                        st.markdown(
+                            f"""
+                            <div style='text-align: center; background-color: #f0f5ff; padding: 10px; border-radius: 10px; margin-top: 10px;'>
+                                <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Media Shared</h1>
+                                <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{num_media_messages}</h1>
+                            </div>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+                    with col4:
+                        st.markdown(
+                            f"""
+                            <div style='text-align: center; background-color: #fff0fc; padding: 10px; border-radius: 10px; margin-top: 10px;'>
+                                <h1 style='color: #A52A2A; font-size: 1.8em; border: 2px solid black; padding: 5px; border-radius: 5px;'>Links Shared</h1>
+                                <h1 style='color: black; font-size: 2em; margin-top: 10px;'>{num_links}</h1>
+                            </div>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+                runner.show(lambda: analyze('fetch_stats', chat_key, selected_user, df, date_range), top_statistics)
+
+            # every section below is computed and drawn only while its tab is open,
+            # switching tabs reruns the script with the new tab selected
+            sections = {
+                'timeline': "📅 Timelines",
+                'activity': "🗺️ Activity Map",
+                'busy_users': "👥 Most Busy Users",
+                'wordcloud': "☁️ WordCloud",
+                'words': "📝 Most Common Words",
+                'emoji': "😊 Emoji Analysis",
+                'sessions': "⏱️ Replies & Sessions",
+            }
+            if selected_user != 'Overall':
+                del sections['busy_users']
+            tabs = dict(zip(sections, st.tabs(list(sections.values()), key='section', on_change='rerun')))
+
+            with tabs['timeline']:
+                if tabs['timeline'].open:
+                    # Monthly timeline
+                    with profiling.stage('chart: monthly timeline'):
+                        # Title with Text Border
+                        st.markdown(
+                            """
+                            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em; text-align: left;'>
+                                📅 Monthly Timeline
+                            </h1>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+                        runner.image(lambda: chart_png('monthly_timeline', chat_key, selected_user, df, date_range))
+
+                    # Daily timeline
+                    with profiling.stage('chart: daily timeline'):
+                        # Title with Text Border
+                        st.markdown(
+                            """
+                            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em;'>
+                                📅 Daily Timeline
+                            </h1>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+                        # long chats are drawn from at most helper.DAILY_POINT_BUDGET points,
+                        # peaks and dips kept, unless every day is asked for
+                        every_day = st.checkbox("Show every day", key='daily_full')
+                        daily = 'daily_timeline' if every_day else 'daily_timeline_sampled'
+                        runner.image(lambda: chart_png(daily, chat_key, selected_user, df, date_range))
+
+            with tabs['activity']:
+                if tabs['activity'].open:
+                    # Activity Map
+                    # Title with Text Border
+                    st.markdown(
+                        """
+                        <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2.1em;'>
+                            🗺️ Activity Map
+                        </h1>
+                        """,
+                        unsafe_allow_html=True,
+                    )
+                    col1, col2 = st.columns(2)
+
+                    # Most Busy Day
+                    with col1:
+                        with profiling.stage('chart: most busy day'):
+                            # Use custom HTML for header styling
+                            st.markdown(
+                                """
+                                <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
+                                    Most Busy Day
+                                </h2>
+                                """, unsafe_allow_html=True
+                            )
+                            runner.image(lambda: chart_png('week_activity_map', chat_key, selected_user, df))
+
+                    # Most Busy Month
+                    with col2:
+                        with profiling.stage('chart: most busy month'):
+                            # Use custom HTML for header styling
+                            st.markdown(
+                                """
+                                <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
+                                    Most Busy Month
+                                </h2>
+                                """, unsafe_allow_html=True
+                            )
+                            runner.image(lambda: chart_png('month_activity_map', chat_key, selected_user, df))
+
+                    # Heatmap
+                    with profiling.stage('chart: activity heatmap'):
+                        # Title with Text Border
+                        st.markdown(
+                            """
+                            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 1.7em;'>
+                                📅 Weekly Activity Map
+                            </h1>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+                        runner.image(lambda: chart_png('activity_heatmap', chat_key, selected_user, df))
+
+            if 'busy_users' in tabs:
+                with tabs['busy_users']:
+                    if tabs['busy_users'].open:
+                        # Busiest Users
+                        with profiling.stage('chart: most busy users'):
+                            # Title with subtle styling
+                            st.markdown(
+                                """
+                                <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em;'>
+                                    👥 Most Busy Users
+                                </h1>
+                                """,
+                                unsafe_allow_html=True,
+                            )
+
+                            # Split the layout into two columns
+                            col1, col2 = st.columns(2)
+
+                            with col1:
+                                # Display the plot
+                                runner.image(lambda: chart_png('most_busy_users', chat_key, 'Overall', df))
+
+                            def busy_users_table(busy_users):
+                                # Get data for busiest users
+                                new_df = busy_users[1]
+
+                                # Format column 2 to display only 2 decimal places
+                                new_df.iloc[:, 1] = new_df.iloc[:, 1].apply(lambda x: f"{x:.2f}")
+
+                                # Rename the columns in new_df
+                                new_df.columns = ['Name', 'Count']
+
+                                # Style the DataFrame for a cleaner look
+                                styled_df = new_df.style.set_properties(**{
+                                    'background-color': '#FFFFFF',
+                                    'color': '#333333',
+                                    'border-color': '#DDDDDD',
+                                    'font-size': '14px',
+                                    'padding': '5px',
+                                })
+                                st.dataframe(styled_df)
+
+                            with col2:
+                                runner.show(lambda: analyze('most_busy_users', chat_key, 'Overall', df), busy_users_table)
+
+                        with profiling.stage('chart: leaderboard'):
+                            # every participant side by side, computed in one grouped pass
+                            st.markdown(
+                                """
+                                <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
+                                    Leaderboard
+                                </h2>
+                                """, unsafe_allow_html=True
+                            )
+
+                            def leaderboard_table(leaderboard):
+                                leaderboard.columns = ['Name', 'Messages', 'Words', 'Media', 'Links', 'Emojis',
+                                                       'Active Days', 'First Message', 'Last Message']
+                                st.dataframe(leaderboard, hide_index=True, width='stretch')
+
+                            runner.show(lambda: analyze('user_leaderboard', chat_key, 'Overall', df), leaderboard_table)
+
+            with tabs['wordcloud']:
+                if tabs['wordcloud'].open:
+                    # WordCloud
+                    with profiling.stage('chart: wordcloud'):
+                        # Add a styled title for better visual appeal
+                        st.markdown(
+                            """
+                            <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px #3498DB; font-size: 2.7em;'>
+                                ☁️ WordCloud
+                            </h1>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+                        def wordcloud_png():
+                            try:
+                                # Generate the WordCloud
+                                return chart_png('create_wordcloud', chat_key, selected_user, df)
+                            except ValueError:
+                                return None
+
+                        def wordcloud_image(png):
+                            if png is None:
+                                # Display an error message if WordCloud generation fails
+                                st.error(
+                                    """
+                                    <h3 style='color: #E74C3C; text-align: center;'>
+                                        Not enough data to generate a WordCloud. Please select another user or overall.
+                                    </h3>
+                                    """,
+                                    unsafe_allow_html=True,
+                                )
+                            else:
+                                st.image(png, width='stretch')
+
+                        runner.show(wordcloud_png, wordcloud_image)
+
+            with tabs['words']:
+                if tabs['words'].open:
+                    # Most Common Words
+                    with profiling.stage('chart: most common words'):
+                        st.markdown(
+                            """
+                            <h1 style='color: #FFFFFF; -webkit-text-stroke: 1px black; font-size: 2.5em; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); text-align: center;'>
+                                📝 Most Common <br> Words
+                            </h1>
+                            """,
+                            unsafe_allow_html=True
+                        )
+
+                        def most_common_png():
+                            most_common_df = analyze('most_common_words', chat_key, selected_user, df)
+                            if most_common_df.empty:
+                                return None
+                            return chart_png('most_common_words', chat_key, selected_user, df)
+
+                        def most_common_image(png):
+                            if png is None:
+                                st.error("No words found for this user.")
+                            else:
+                                st.image(png, width='stretch')
+
+                        runner.show(most_common_png, most_common_image)
+
+            with tabs['emoji']:
+                if tabs['emoji'].open:
+                    # Emoji Analysis
+                    with profiling.stage('chart: emoji analysis'):
+                        st.markdown(
+                            """
+                            <h1 style='color: #FFFFFF; -webkit-text-stroke: 1px black; font-size: 2.2em; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5)'>
+                                😊 Emoji Analysis
+                            </h1>
+                            """,
+                            unsafe_allow_html=True
+                        )
+
+                        def emoji_table(emoji_df):
+                            if emoji_df.empty:
+                                st.error("Not enough data for emoji analysis.")
+                            else:
+                                # Rename the columns in emoji_df
+                                emoji_df.columns = ['Emoji', 'Count']
+                                # Split the layout into two columns
+                                col1, col2 = st.columns(2)
+
+                                # Column 1: Display DataFrame
+                                with col1:
+
+                                    # Adjust the table dimensions and styling
+                                    styled_emoji_df = emoji_df.style.set_properties(
+                                        **{
+                                            'background-color': '#1E1E1E',  # Dark background for cells
+                                            'color': 'white',  # White text
+                                            'border-color': '#555555',  # Subtle border color
+                                            'border-width': '1px',
+                                            'border-style': 'solid',
+                                            'font-size': '16px',  # Larger font size
+                                            'padding': '10px',  # Padding for better spacing
+                                        }
+                                    ).highlight_max(axis=0, color='#FFD700')  # Highlight max values in yellow
+
+                                    # Use Streamlit's styling to increase table size
+                                    st.markdown(
+                                        """
+                                        <style>
+                                        .dataframe tbody tr th {
+                                            font-size: 18px;  /* Larger font size for row headers */
+                                        }
+                                        .dataframe tbody tr td {
+                                            font-size: 16px;  /* Larger font size for cell values */
+                                        }
+                                        .dataframe {
+                                            margin: 20px auto;  /* Center align table */
+                                            width: 95%;  /* Make the table wider */
+                                            background-color: #2E2E2E; /* Match background to table */
+                                            border-radius: 10px; /* Rounded edges */
+                                            overflow: hidden; /* Keep table clean */
+                                        }
+                                        </style>
+                                        """,
+                                        unsafe_allow_html=True,
+                                    )
+                                    # Display the styled DataFrame
+                                    st.dataframe(styled_emoji_df, width='stretch')
+
+                        # Get emoji data
+                        runner.show(lambda: analyze('emoji_helper', chat_key, selected_user, df), emoji_table)
+
+            with tabs['sessions']:
+                if tabs['sessions'].open:
+                    # Reply times and conversation sessions
+                    st.markdown(
+                        """
+                        <h1 style='color: white; font-family: "Arial", sans-serif; text-shadow: 2px 2px 4px rgba(0,0,0,0.5); -webkit-text-stroke: 1px black; font-size: 2em;'>
+                            ⏱️ Replies & Sessions
+                        </h1>
+                        """,
+                        unsafe_allow_html=True,
+                    )
+                    gap = st.number_input("Minutes of silence that end a session", min_value=1,
+                                          value=helper.SESSION_GAP_MINUTES, step=5, key='session_gap')
+
+                    with profiling.stage('chart: sessions'):
+                        def session_metrics(sessions):
+                            col1, col2, col3 = st.columns(3)
+                            col1.metric("Sessions", sessions.shape[0])
+                            if not sessions.empty:
+                                col2.metric("Median length", f"{sessions['minutes'].median():.0f} min")
+                                col3.metric("Median messages", f"{sessions['messages'].median():.0f}")
+
+                        runner.show(lambda: analyze('conversation_sessions', chat_key, selected_user, df, gap_minutes=gap),
+                                    session_metrics)
+
+                        # who opens and who closes the conversations
+                        st.markdown(
+                            """
+                            <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
+                                Session Starters
+                            </h2>
+                            """, unsafe_allow_html=True
+                        )
+
+                        def initiators_table(initiators):
+                            initiators.columns = ['Name', 'Sessions', 'Started', 'Ended']
+                            st.dataframe(initiators, hide_index=True, width='stretch')
+
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            runner.image(lambda: chart_png('session_initiators', chat_key, selected_user, df, gap_minutes=gap))
+                        with col2:
+                            runner.show(lambda: analyze('session_initiators', chat_key, selected_user, df, gap_minutes=gap),
+                                        initiators_table)
+
+                    with profiling.stage('chart: reply times'):
+                        st.markdown(
+                            """
+                            <h2 style='color: white; font-size: 2em; -webkit-text-stroke: 1px black; font-weight: bold;'>
+                                Reply Times
+                            </h2>
+                            """, unsafe_allow_html=True
+                        )
+
+                        def replies_table(replies):
+                            if replies.empty:
+                                st.error("No replies between different users.")
+                            else:
+                                replies.columns = ['Name', 'Replying To', 'Replies', 'Median Minutes']
+                                st.dataframe(replies, hide_index=True, width='stretch')
+
+                        runner.show(lambda: analyze('reply_times', chat_key, selected_user, df), replies_table)
+
+            # in concurrent mode the placeholders above are filled in here, as
+            # their results come in
+            with profiling.stage('sections'):
+                runner.finish()
+finally:
+    recorder = profiling.stop_recording()
+
+
+if diagnostics and recorder is not None:
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        records = recorder.records()
+        if records:
+            stages_df = pd.DataFrame(records)
+            stages_df['peak_mb'] = pd.to_numeric(stages_df['peak_bytes']) / 2 ** 20
+            st.dataframe(stages_df[['stage', 'calls', 'wall_seconds', 'cpu_seconds', 'peak_mb']],
+                         hide_index=True, width='stretch')
+            st.caption("Times include nested stages. Cached results do not show up.")
+            if not recorder.trace_memory:
+                st.caption("Peak memory is not traced with concurrent sections.")
+        else:
+            st.caption("Nothing was computed on this run, every result came from the cache.")
+        st.download_button("Export JSON", json.dumps({
+            'chat_key': chat_key if uploaded_file is not None else None,
+            'stages': records,
+        }, indent=2), file_name="diagnostics.json", mime="application/json")
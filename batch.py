@@ -0,0 +1,182 @@
+# Runs preprocess and every helper analysis over many chat exports without the
+# web app, one chat per worker process:
+#   python batch.py exports/ "archive/**/*.txt" -o results -j 8
+# Zipped exports with media are read too, only their chat text is decoded.
+# --store adds every parsed chat to the SQLite chat store for cross-chat queries.
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import time
+import zipfile
+
+import pandas as pd
+
+import chat_cache
+import chat_store
+import exports
+import helper
+import links
+import preprocessor
+
+# the tables every chat gets, as (file name, helper) run for 'Overall'
+TABLES = [
+    ('monthly_timeline', helper.monthly_timeline),
+    ('daily_timeline', helper.daily_timeline),
+    ('week_activity_map', helper.week_activity_map),
+    ('month_activity_map', helper.month_activity_map),
+    ('activity_heatmap', helper.activity_heatmap),
+    ('most_common_words', helper.most_common_words),
+    ('emoji_helper', helper.emoji_helper),
+    ('reply_times', helper.reply_times),
+    ('conversation_sessions', helper.conversation_sessions),
+    ('session_initiators', helper.session_initiators),
+]
+
+SUMMARY_COLUMNS = ['chat', 'output', 'bytes', 'messages', 'words', 'media', 'links', 'users',
+                   'first_message', 'last_message', 'parse_seconds', 'seconds', 'error']
+
+
+def find_chats(paths):
+    # directories are searched for .txt and .zip exports, anything else is a file or a glob
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ('*.txt', '*.zip'):
+                found.extend(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        elif os.path.isfile(path):
+            found.append(path)
+        else:
+            found.extend(glob.glob(path, recursive=True))
+    return sorted(set(found))
+
+
+def output_names(chats):
+    # file names without extension, made unique when two exports share one
+    names = []
+    seen = {}
+    for chat in chats:
+        name = os.path.splitext(os.path.basename(chat))[0]
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}-{seen[name]}")
+    return names
+
+
+def table_frame(name, result):
+    if isinstance(result, pd.Series):
+        return result.rename('count').reset_index()
+    if name == 'most_common_words':
+        result = result.set_axis(['word', 'count'][:result.shape[1]], axis=1)
+    elif name == 'emoji_helper':
+        result = result.set_axis(['emoji', 'count'][:result.shape[1]], axis=1)
+    elif name == 'activity_heatmap':
+        result = result.reset_index()
+    return result
+
+
+def write_table(df, path, output_format):
+    if output_format == 'parquet':
+        df.to_parquet(path + '.parquet', index=False)
+    else:
+        df.to_json(path + '.json', orient='records', date_format='iso', force_ascii=False)
+
+
+def write_wordcloud(df, path):
+    try:
+        helper.create_wordcloud('Overall', df).to_file(path + '.png')
+    except ValueError:
+        # no words left after stop word filtering
+        pass
+
+
+def analyze_chat(job):
+    chat, out_dir, output_format, wordcloud, store = job
+    row = {'chat': chat, 'output': out_dir}
+    start = time.perf_counter()
+    try:
+        digest = chat_cache.StreamDigest()
+        with exports.open_chat(chat) as stream:
+            data, row['bytes'] = exports.read_text(stream, digest.update)
+        df = preprocessor.preprocess(data, workers=1)
+        row['parse_seconds'] = time.perf_counter() - start
+
+        os.makedirs(out_dir, exist_ok=True)
+        num_messages, num_words, num_media_messages, num_links = helper.fetch_stats('Overall', df)
+        row.update(messages=num_messages, words=num_words, media=num_media_messages, links=num_links,
+                   users=int((df['user'].unique() != 'group_notification').sum()),
+                   first_message=str(df['date'].min()), last_message=str(df['date'].max()))
+
+        for name, analysis in TABLES:
+            write_table(table_frame(name, analysis('Overall', df)), os.path.join(out_dir, name), output_format)
+        busy_users = helper.most_busy_users(df)[1].set_axis(['user', 'percent'], axis=1)
+        write_table(busy_users, os.path.join(out_dir, 'most_busy_users'), output_format)
+        write_table(helper.user_leaderboard(df), os.path.join(out_dir, 'user_leaderboard'), output_format)
+        if wordcloud:
+            write_wordcloud(df, os.path.join(out_dir, 'wordcloud'))
+        if store:
+            with closing(chat_store.connect(store)) as conn:
+                chat_store.ingest(conn, digest.hexdigest(), os.path.basename(chat), df)
+    except (OSError, UnicodeDecodeError, ValueError, zipfile.BadZipFile, sqlite3.Error) as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    row['seconds'] = time.perf_counter() - start
+
+    if 'error' not in row:
+        with open(os.path.join(out_dir, 'stats.json'), 'w') as f:
+            json.dump(row, f, indent=2)
+    return row
+
+
+def init_worker():
+    # every worker already has a chat of its own, no nested link pools
+    links.MAX_WORKERS = 1
+
+
+def run(chats, output, output_format='json', workers=None, wordcloud=True, store=None):
+    jobs = [(chat, os.path.join(output, name), output_format, wordcloud, store)
+            for chat, name in zip(chats, output_names(chats))]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        init_worker()
+        return [analyze_chat(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        return list(pool.map(analyze_chat, jobs, chunksize=1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze WhatsApp chat exports without the web app.")
+    parser.add_argument('paths', nargs='+', help="chat files, directories of .txt or .zip exports or glob patterns")
+    parser.add_argument('-o', '--output', default='results', help="directory for the results (default: results)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--format', choices=['json', 'parquet'], default='json', help="per-chat table format")
+    parser.add_argument('--no-wordcloud', action='store_true', help="skip the word cloud images")
+    parser.add_argument('--store', nargs='?', const=chat_store.STORE_PATH, default=None,
+                        help=f"also add every chat to this SQLite chat store (default: {chat_store.STORE_PATH})")
+    parser.add_argument('--top', type=int, default=10, help="slowest chats to list in the report")
+    args = parser.parse_args(argv)
+
+    chats = find_chats(args.paths)
+    if not chats:
+        parser.error("no chat files found")
+
+    start = time.perf_counter()
+    rows = run(chats, args.output, args.format, args.jobs, not args.no_wordcloud, args.store)
+    elapsed = time.perf_counter() - start
+
+    # one row per chat: the top statistics, timings and any error
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    os.makedirs(args.output, exist_ok=True)
+    summary.to_csv(os.path.join(args.output, 'summary.csv'), index=False)
+
+    timings = summary.sort_values('seconds', ascending=False).head(args.top)
+    print(timings[['chat', 'parse_seconds', 'seconds']].to_string(index=False, float_format='%.3f'))
+    failed = summary['error'].notna().sum()
+    print(f"{len(rows)} chats ({failed} failed) in {elapsed:.2f}s, {len(rows) / elapsed:.2f} chats/s, "
+          f"summary in {os.path.join(args.output, 'summary.csv')}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
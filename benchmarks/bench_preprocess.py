@@ -0,0 +1,82 @@
+# Times the sender/message split and period derivation of preprocess against
+# the old per-row loops, run with: python benchmarks/bench_preprocess.py
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import preprocessor
+
+USERS = ['Aman', 'Priya Sharma', '+91 98765 43210', 'Rahul', 'Neha']
+WORDS = 'hello kya haal hai bro ok lol yes no time meeting kal milte hain 😂 https://example.com'.split()
+
+
+def make_user_messages(n, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n):
+        if rng.random() < 0.03:
+            messages.append('Aman added Neha\n')
+        else:
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+            messages.append(rng.choice(USERS) + ': ' + text + '\n')
+    return messages
+
+
+def old_split(user_messages):
+    users = []
+    messages = []
+    for message in user_messages:
+        entry = re.split('([\\w\\W]+?):\\s', message)
+        if len(entry) > 1:
+            users.append(entry[1])
+            messages.append(" ".join(entry[2:]))
+        else:
+            users.append('group_notification')
+            messages.append(entry[0])
+    return users, messages
+
+
+def old_period(hours):
+    period = []
+    for hour in hours:
+        if hour == 23:
+            period.append(str(hour) + "-" + str('00'))
+        elif hour == 0:
+            period.append(str('00') + "-" + str(hour + 1))
+        else:
+            period.append(str(hour) + "-" + str(hour + 1))
+    return period
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(n):
+    user_messages = make_user_messages(n)
+    dates = ['01/01/21, 3:17 am - '] * n
+    hours = pd.Series([random.Random(i).randrange(24) for i in range(n)])
+
+    old_split_time, (users, messages) = timed(old_split, user_messages)
+    new_split_time, df = timed(preprocessor.build_frame, dates, user_messages)
+    assert df['user'].tolist() == users and df['message'].tolist() == messages
+
+    old_period_time, period = timed(old_period, hours)
+    new_period_time, new_period = timed(lambda h: preprocessor.PERIODS[h.to_numpy()], hours)
+    assert new_period.tolist() == period
+
+    print(f"{n:>9,} messages  split: {old_split_time:7.2f}s -> {new_split_time:6.2f}s "
+          f"(x{old_split_time / new_split_time:.1f})  period: {old_period_time:6.2f}s -> "
+          f"{new_period_time:6.3f}s (x{old_period_time / new_period_time:.0f})")
+
+
+if __name__ == '__main__':
+    for n in [100_000, 1_000_000]:
+        run(n)
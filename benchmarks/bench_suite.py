@@ -0,0 +1,171 @@
+# Times and memory-profiles every stage of the analysis on synthetic chats and
+# compares the results with benchmarks/baselines.json:
+#   python benchmarks/bench_suite.py --sizes 10000 100000      compare, exit 1 on a regression
+#   python benchmarks/bench_suite.py --sizes 10000 --save      record new baselines
+# Baselines are machine specific, record them on the machine that checks them.
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+import analytics
+import emoji_matcher
+import helper
+import links
+import preprocessor
+import tokenizer
+from synthetic_chat import generate_chat
+
+BASELINES_FILE = os.path.join(HERE, 'baselines.json')
+SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+
+# allowed slowdown and memory growth over the baseline, differences below the
+# floors are noise
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+TIME_FLOOR = 0.02
+MEMORY_FLOOR = 1024 * 1024
+
+
+def forget_frames():
+    # the next stage starts without any per-frame caches
+    analytics._frame_caches.clear()
+    gc.collect()
+
+
+def stages(text):
+    # (name, setup, stage), setup runs untimed and returns the stage's argument;
+    # the summary stages start cold, the helpers read a warm summary like the app
+    def parsed():
+        return preprocessor.preprocess(text)
+
+    def cold():
+        forget_frames()
+        return df
+
+    def warm():
+        analytics.chat_summary('Overall', df)
+        return df
+
+    df = parsed()
+    return [
+        ('preprocess', lambda: text, preprocessor.preprocess),
+        ('tokenize', cold, lambda df: tokenizer.tokenize_messages(df['user'], df['message'])),
+        ('count_links', cold, lambda df: links.count_links(df['message'])),
+        ('count_emojis', cold, lambda df: emoji_matcher.count_emojis(df['message'])),
+        ('bucket_counts', cold, analytics.bucket_counts),
+        ('chat_summary', cold, lambda df: analytics.chat_summary('Overall', df)),
+        ('time_index', cold, lambda df: analytics.time_index('Overall', df)),
+        ('fetch_stats', warm, lambda df: helper.fetch_stats('Overall', df)),
+        ('most_busy_users', warm, helper.most_busy_users),
+        ('monthly_timeline', warm, lambda df: helper.monthly_timeline('Overall', df)),
+        ('daily_timeline', warm, lambda df: helper.daily_timeline('Overall', df)),
+        ('week_activity_map', warm, lambda df: helper.week_activity_map('Overall', df)),
+        ('month_activity_map', warm, lambda df: helper.month_activity_map('Overall', df)),
+        ('activity_heatmap', warm, lambda df: helper.activity_heatmap('Overall', df)),
+        ('most_common_words', warm, lambda df: helper.most_common_words('Overall', df)),
+        ('emoji_helper', warm, lambda df: helper.emoji_helper('Overall', df)),
+        ('create_wordcloud', warm, lambda df: helper.create_wordcloud('Overall', df)),
+        ('reply_times', cold, lambda df: helper.reply_times('Overall', df)),
+        ('conversation_sessions', cold, lambda df: helper.conversation_sessions('Overall', df)),
+    ]
+
+
+def measure(setup, stage, repeat):
+    # best of repeat runs for the time, then one traced run for the peak of
+    # Python and numpy allocations (worker processes are not traced)
+    best = float('inf')
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        stage(arg)
+        best = min(best, time.perf_counter() - start)
+
+    arg = setup()
+    tracemalloc.start()
+    stage(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def run(size, seed=0):
+    text = generate_chat(size, seed=seed)
+    repeat = max(1, min(5, 100_000 // size))
+    results = {}
+    for name, setup, stage in stages(text):
+        results[name] = measure(setup, stage, repeat)
+    forget_frames()
+    return results
+
+
+def regressions(size, results, baselines):
+    found = []
+    for name, result in results.items():
+        base = baselines.get(str(size), {}).get(name)
+        if base is None:
+            print(f"  no baseline for {name} at {size:,} messages, not checked (record one with --save)")
+            continue
+        if result['seconds'] > base['seconds'] * (1 + TIME_TOLERANCE) and \
+                result['seconds'] - base['seconds'] > TIME_FLOOR:
+            found.append(f"{size:,} {name}: {result['seconds']:.3f}s, baseline {base['seconds']:.3f}s")
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + MEMORY_TOLERANCE) and \
+                result['peak_bytes'] - base['peak_bytes'] > MEMORY_FLOOR:
+            found.append(f"{size:,} {name}: {result['peak_bytes'] / 2 ** 20:.1f} MB, "
+                         f"baseline {base['peak_bytes'] / 2 ** 20:.1f} MB")
+    return found
+
+
+def report(size, results, baselines):
+    print(f"\n{size:,} messages")
+    for name, result in results.items():
+        base = baselines.get(str(size), {}).get(name)
+        change = f"  ({result['seconds'] / base['seconds']:.2f}x baseline)" if base and base['seconds'] else ''
+        print(f"  {name:<20}{result['seconds']:9.3f}s{result['peak_bytes'] / 2 ** 20:10.1f} MB{change}")
+
+
+def load_baselines(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every analysis stage on synthetic chats.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="message counts to benchmark")
+    parser.add_argument('--baselines', default=BASELINES_FILE, help="baseline file to compare with or save to")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baselines")
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines(args.baselines)
+    found = []
+    for size in args.sizes:
+        results = run(size)
+        report(size, results, baselines)
+        if args.save:
+            baselines[str(size)] = results
+        elif str(size) not in baselines:
+            print(f"  no baseline for {size:,} messages, not checked (record one with --save)")
+        else:
+            found.extend(regressions(size, results, baselines))
+
+    if args.save:
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nbaselines saved to {args.baselines}")
+        return 0
+    if found:
+        print("\nregressions:\n  " + "\n  ".join(found))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+# Deterministic synthetic WhatsApp exports in the 'dd/mm/yy, hh:mm am - user: message'
+# format, the same seed and settings always give the same text:
+#   python benchmarks/synthetic_chat.py -n 100000 --users 12 > chat.txt
+import argparse
+import datetime
+import random
+import sys
+
+FIRST_NAMES = ['Aman', 'Priya', 'Rahul', 'Neha', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Ishita',
+               'Karan', 'Pooja', 'Aditya', 'Meera', 'Siddharth', 'Ananya']
+LAST_NAMES = ['Sharma', 'Verma', 'Gupta', 'Iyer', 'Reddy', 'Das', 'Khan', 'Mehta']
+WORDS = ('hello kya haal hai bro ok lol yes no time meeting kal milte hain chal theek acha sahi '
+         'bhai yaar kab kahan kaun party movie dinner office traffic late sorry thanks done').split()
+EMOJIS = ['\U0001f602', '\U0001f44d', '\U0001f44d\U0001f3fd', '\u2764\ufe0f', '\U0001f64f', '\U0001f60d',
+          '\U0001f1ee\U0001f1f3', '\U0001f468\u200d\U0001f469\u200d\U0001f467', '\U0001f525', '\U0001f62d']
+URLS = ['https://example.com/post/{}', 'www.example.org/{}', 'http://news.example.in/a/{}',
+        'https://youtu.be/{}', 'example.net/p?id={}']
+
+
+def user_names(count, rng):
+    names = []
+    for i in range(count):
+        if i % 5 == 4:
+            # saved contacts show up as phone numbers
+            names.append(f"+91 9{rng.randrange(1000, 10000)} {rng.randrange(10000, 100000)}")
+        else:
+            name = FIRST_NAMES[i % len(FIRST_NAMES)]
+            if i >= len(FIRST_NAMES) or i % 2:
+                name += ' ' + LAST_NAMES[i % len(LAST_NAMES)]
+            if i >= len(FIRST_NAMES):
+                name += f" {i // len(FIRST_NAMES)}"
+            names.append(name)
+    return names
+
+
+def sentence(rng, emoji_rate, url_rate):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 14))]
+    if rng.random() < emoji_rate:
+        words.insert(rng.randrange(len(words) + 1), ''.join(rng.choice(EMOJIS) for _ in range(rng.randint(1, 3))))
+    if rng.random() < url_rate:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(URLS).format(rng.randrange(10 ** 6)))
+    return ' '.join(words)
+
+
+def stamp(moment):
+    return moment.strftime('%d/%m/%y, %I:%M ') + moment.strftime('%p').lower() + ' - '
+
+
+def generate_chat(messages=10000, users=5, multiline_rate=0.05, emoji_rate=0.1, url_rate=0.05,
+                  media_rate=0.05, notification_rate=0.01, days=365,
+                  start=datetime.datetime(2021, 1, 1), seed=0):
+    rng = random.Random(seed)
+    names = user_names(users, rng)
+    # messages spread over the span in time order, stamps repeat within a minute
+    minutes = sorted(rng.randrange(days * 24 * 60) for _ in range(messages))
+    stamps = {}
+    lines = []
+    for minute in minutes:
+        if minute not in stamps:
+            stamps[minute] = stamp(start + datetime.timedelta(minutes=minute))
+        prefix = stamps[minute]
+        kind = rng.random()
+        if kind < notification_rate:
+            lines.append(f"{prefix}{rng.choice(names)} added {rng.choice(names)}\n")
+        elif kind < notification_rate + media_rate:
+            lines.append(f"{prefix}{rng.choice(names)}: <Media omitted>\n")
+        else:
+            text = sentence(rng, emoji_rate, url_rate)
+            while rng.random() < multiline_rate:
+                # continuation lines, some with a colon the sender split must not take
+                text += '\n' + ('note: ' if rng.random() < 0.3 else '') + sentence(rng, emoji_rate, url_rate)
+            lines.append(f"{prefix}{rng.choice(names)}: {text}\n")
+    return ''.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic WhatsApp chat export to stdout.")
+    parser.add_argument('-n', '--messages', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--multiline-rate', type=float, default=0.05)
+    parser.add_argument('--emoji-rate', type=float, default=0.1)
+    parser.add_argument('--url-rate', type=float, default=0.05)
+    parser.add_argument('--media-rate', type=float, default=0.05)
+    parser.add_argument('--notification-rate', type=float, default=0.01)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stdout.write(generate_chat(args.messages, args.users, args.multiline_rate, args.emoji_rate, args.url_rate,
+                                   args.media_rate, args.notification_rate, args.days, seed=args.seed))
+
+
+if __name__ == '__main__':
+    main()
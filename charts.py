@@ -0,0 +1,285 @@
+import io
+import threading
+
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from profiling import profiled
+
+# the figures of the dashboard, one per helper result, rendered to PNG bytes
+# so the app can cache the image instead of the figure
+
+# held while a figure is built and rendered, pyplot's current figure is
+# shared by every thread
+draw_lock = threading.Lock()
+
+# date labels on the daily timeline
+MAX_DATE_TICKS = 24
+
+
+def monthly_timeline(timeline):
+    # Create a plot with a customized background
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Change the background color of the plot
+    ax.set_facecolor('#2E2E2E')  # Dark background for the plot
+    fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
+
+    # Plot the timeline data with custom color
+    ax.plot(timeline['time'], timeline['message'], color='red', linewidth=2)
+
+    # Add gridlines with a different color
+    ax.grid(True, color='white', linestyle='--', linewidth=0.5)
+
+    # Customize x-axis labels (rotate them for better visibility)
+    plt.xticks(rotation='vertical', color='white', fontsize=12)
+
+    # Customize y-axis labels and set the color to white
+    plt.yticks(color='white', fontsize=12)
+
+    plt.title(" ") #to make gap in top
+
+    # Add y-axis and x-axis labels (optional)
+    ax.set_xlabel('Time', fontsize=14, color='white', labelpad=15)
+    ax.set_ylabel('Messages', fontsize=14, color='white', labelpad=15)
+
+    # Adjust layout to avoid clipping
+    plt.tight_layout()
+    return fig
+
+
+def daily_timeline(daily_timeline):
+    # Create the daily timeline plot with a customized background
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Change the background color of the plot
+    ax.set_facecolor('#2E2E2E')  # Dark background for the plot
+    fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
+
+    # Plot the daily timeline data with a custom color
+    ax.plot(daily_timeline['only_date'], daily_timeline['message'], color='green', linewidth=2)
+
+    # Add gridlines with a different color
+    ax.grid(True, color='white', linestyle='--', linewidth=0.5)
+
+    # at most MAX_DATE_TICKS date labels however many days are plotted
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator(maxticks=MAX_DATE_TICKS))
+
+    # Customize x-axis labels (rotate them for better visibility) and set the color to white
+    plt.xticks(rotation='vertical', color='white', fontsize=12)
+
+    # Customize y-axis labels and set the color to white
+    plt.yticks(color='white', fontsize=12)
+
+    # Add x-axis and y-axis labels (optional)
+    ax.set_xlabel('Date', fontsize=14, color='white', labelpad=20)
+    ax.set_ylabel('Messages', fontsize=14, color='white', labelpad=18)
+
+    # Title
+    plt.title(" ")
+
+    # Adjust layout to avoid clipping
+    plt.tight_layout()
+    return fig
+
+
+def daily_timeline_sampled(points):
+    return daily_timeline(points)
+
+
+def activity_bars(counts, color, xlabel):
+    # Create the figure and axis for the plot
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Set background color for the plot
+    ax.set_facecolor('#2E2E2E')  # Dark background for the plot
+    fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
+
+    # Bar plot of the counts
+    ax.bar(counts.index, counts.values, color=color, edgecolor='black', linewidth=1.5)
+
+    # Customize x-axis labels and rotate them
+    plt.xticks(rotation='vertical', color='white', fontsize=12)
+
+    # Customize y-axis labels
+    plt.yticks(color='white', fontsize=12)
+
+    plt.title(" ")
+
+    # Set axis labels with padding
+    ax.set_xlabel(xlabel, fontsize=14, color='white', labelpad=15)
+    ax.set_ylabel('Number of Messages', fontsize=14, color='white', labelpad=15)
+
+    # Add gridlines with a lighter color and dashed lines for style
+    ax.grid(True, color='white', linestyle='--', linewidth=0.5)
+
+    # Adjust layout to avoid clipping
+    plt.tight_layout()
+    return fig
+
+
+def week_activity_map(busy_day):
+    return activity_bars(busy_day, 'purple', 'Day of the Week')
+
+
+def month_activity_map(busy_month):
+    return activity_bars(busy_month, 'orange', 'Month')
+
+
+def session_initiators(initiators):
+    # Create the figure and axis for the plot
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Set background color for the plot
+    ax.set_facecolor('#2E2E2E')  # Dark background for the plot
+    fig.patch.set_facecolor('#1C1C1C')  # Dark background for the figure
+
+    # Sessions started and ended side by side for every user
+    positions = range(initiators.shape[0])
+    ax.bar([p - 0.2 for p in positions], initiators['started'], width=0.4, color='teal',
+           edgecolor='black', linewidth=1.5, label='Started')
+    ax.bar([p + 0.2 for p in positions], initiators['ended'], width=0.4, color='salmon',
+           edgecolor='black', linewidth=1.5, label='Ended')
+    ax.set_xticks(list(positions))
+    ax.set_xticklabels(initiators['user'])
+    ax.legend()
+
+    # Customize x-axis labels and rotate them
+    plt.xticks(rotation='vertical', color='white', fontsize=12)
+
+    # Customize y-axis labels
+    plt.yticks(color='white', fontsize=12)
+
+    plt.title(" ")
+
+    # Set axis labels with padding
+    ax.set_xlabel('Users', fontsize=14, color='white', labelpad=15)
+    ax.set_ylabel('Sessions', fontsize=14, color='white', labelpad=15)
+
+    # Add gridlines with a lighter color and dashed lines for style
+    ax.grid(True, color='white', linestyle='--', linewidth=0.5)
+
+    # Adjust layout to avoid clipping
+    plt.tight_layout()
+    return fig
+
+
+def activity_heatmap(user_heatmap):
+    # Create the figure and axis for the plot
+    fig, ax = plt.subplots()
+
+    # Set the background color for the plot and figure to a lighter shade
+    ax.set_facecolor('#2E2E2E')  # Light background for the plot
+    fig.patch.set_facecolor('#1C1C1C')  # Light background for the figure
+
+    # Create the heatmap without annotations and customize the color bar
+    ax = sns.heatmap(
+        user_heatmap,
+        cmap='YlGnBu',
+        cbar_kws={
+            'shrink': 0.8,
+            'ticks': [0, 50, 100, 150, 200, 250, 300],  # Adjust tick range as per your data
+            'format': "%.0f"  # Format ticks as integers
+        },
+        annot=False  # Remove numbers inside the heatmap
+    )
+
+    # Customize the color bar appearance
+    cbar = ax.collections[0].colorbar
+    cbar.ax.tick_params(colors='white')  # Change color bar tick labels to black
+    cbar.ax.yaxis.label.set_color('white')  # Change color of the color bar label (if any)
+
+    # Customize x-axis labels and rotate them
+    plt.xticks(rotation='vertical', color='white', fontsize=8)
+
+    # Customize y-axis labels
+    plt.yticks(color='white', fontsize=12)
+
+    # Set axis labels with padding
+    ax.set_xlabel('Month', fontsize=10, color='white', labelpad=15)
+    ax.set_ylabel('Number of Messages', fontsize=10, color='white')
+
+    plt.title(" ")
+    return fig
+
+
+def most_busy_users(busy_users):
+    x = busy_users[0]
+    fig, ax = plt.subplots()
+
+    # Customize the bar plot with minimal styling
+    ax.bar(
+        x.index, x.values,
+        color=['#FF6F61', '#FFA07A', '#FA8072', '#E9967A', '#FF4500'],
+        edgecolor='black',
+        linewidth=1
+    )
+
+    # Rotate x-axis labels for better readability
+    plt.xticks(rotation='vertical', fontsize=10, color='black')
+    plt.yticks(fontsize=10, color='black')
+
+    # Add title and labels with slight padding
+    plt.title(" ")
+    ax.set_xlabel('Users', fontsize=12, labelpad=10)
+    ax.set_ylabel('Message Count', fontsize=12, labelpad=10)
+
+    # Set light grey background for the plot
+    ax.set_facecolor('#F9F9F9')
+    fig.patch.set_facecolor('#FFFFFF')
+    return fig
+
+
+def create_wordcloud(df_wc):
+    # Create the figure and axis for displaying the WordCloud
+    fig, ax = plt.subplots(figsize=(8, 6))  # Adjust size for better visibility
+    ax.imshow(df_wc, interpolation='bilinear')
+    ax.axis('off')  # Turn off axis to focus on the WordCloud
+    fig.patch.set_facecolor('#F0F8FF')  # Light blue background for the figure
+    return fig
+
+
+def most_common_words(most_common_df):
+    # Create figure and axis for the plot
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Create a horizontal bar plot with a cool color palette
+    bars = ax.barh(most_common_df[0], most_common_df[1], color='lightblue', edgecolor='black')
+
+    # Add value labels on bars for clarity
+    for bar in bars:
+        width = bar.get_width()
+        ax.text(
+            width + 0.8,
+            bar.get_y() + bar.get_height() / 2,
+            f'{width:.0f}',
+            va='center',
+            fontsize=12,
+            color='black'
+        )
+
+    # Set x-axis label and y-axis label with styling
+    ax.set_xlabel('Frequency', fontsize=14, color='black', labelpad=15)
+    ax.set_ylabel('Words', fontsize=14, color='black', labelpad=15)
+    plt.title(" ")
+
+    # Set a soft gradient background for the plot
+    ax.set_facecolor('#F0F8FF')  # Light blue color for the plot background
+
+    # Customize the background of the figure
+    fig.patch.set_facecolor('#fbaed2')  # Sky blue color for the figure background
+
+    # Customize x-ticks and y-ticks
+    plt.xticks(rotation='vertical', fontsize=12, color='black')
+    plt.yticks(fontsize=15, color='black')
+    return fig
+
+
+@profiled
+def render_png(fig):
+    # same options st.pyplot uses, then the figure is freed
+    image = io.BytesIO()
+    fig.savefig(image, format='png', dpi=200, bbox_inches='tight')
+    plt.close(fig)
+    return image.getvalue()
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+import tempfile
+import weakref
+import zipfile
+
+import pandas as pd
+
+import analytics
+import exports
+import preprocessor
+from profiling import profiled, stage
+from timestamps import sniff_format
+
+# parsed chats are kept as Parquet files named after the hash of the upload
+CACHE_DIR = os.environ.get(
+    'CHAT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'whatsapp_chat_analysis'))
+CACHE_MAX_BYTES = int(os.environ.get('CHAT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+SUFFIX = '.parquet'
+# next to every frame: what is needed to recognize and extend it
+META_SUFFIX = '.json'
+
+# bytes hashed to find cached chats a new upload may extend
+HEAD_BYTES = 64 * 1024
+
+# frames handed out by this process, so an extension can reuse their computed panels
+_loaded = weakref.WeakValueDictionary()
+
+
+def chat_hash(bytes_data):
+    return hashlib.sha256(bytes_data).hexdigest()
+
+
+class StreamDigest:
+    # chat_hash of everything fed to it so far, plus the hash of the first
+    # n bytes for every n in cuts taken on the way, for streams that are
+    # never held in full
+    def __init__(self, cuts=()):
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.cuts = sorted(set(cuts))
+        self.prefixes = {}
+
+    def update(self, chunk):
+        end = self.size + len(chunk)
+        for cut in self.cuts:
+            if self.size < cut <= end:
+                prefix = self.hash.copy()
+                prefix.update(chunk[:cut - self.size])
+                self.prefixes[cut] = prefix.hexdigest()
+        self.hash.update(chunk)
+        self.size = end
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def head(self):
+        return self.prefixes.get(HEAD_BYTES, self.hexdigest())
+
+
+def entry_path(key, cache_dir=CACHE_DIR, suffix=SUFFIX):
+    # the parser version is part of the name, so a parser change never reads old entries
+    return os.path.join(cache_dir, f"{key}-v{preprocessor.PARSER_VERSION}{suffix}")
+
+
+@profiled
+def load(key, cache_dir=CACHE_DIR):
+    if key in _loaded:
+        return _loaded[key]
+
+    path = entry_path(key, cache_dir)
+    try:
+        df = pd.read_parquet(path)
+    except FileNotFoundError:
+        return None
+    except (ImportError, OSError, ValueError):
+        # no parquet engine installed or a broken entry, parse again
+        return None
+
+    # mark as recently used for the LRU eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    _loaded[key] = df
+    return df
+
+
+@profiled
+def store(key, df, meta, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    _loaded[key] = df
+    # a cache directory that cannot be used only means the chat is parsed again next time
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        os.close(fd)
+    except OSError:
+        return
+    try:
+        df.to_parquet(tmp_path, index=False)
+        with open(entry_path(key, cache_dir, META_SUFFIX), 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, entry_path(key, cache_dir))
+    except (ImportError, OSError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    try:
+        evict(cache_dir, max_bytes)
+    except OSError:
+        pass
+
+
+def remove(path):
+    os.remove(path)
+    meta_path = path[:-len(SUFFIX)] + META_SUFFIX
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    version = f"-v{preprocessor.PARSER_VERSION}"
+    entries = []
+    for entry in os.scandir(cache_dir):
+        name, suffix = os.path.splitext(entry.name)
+        if suffix not in (SUFFIX, META_SUFFIX):
+            continue
+        if not name.endswith(version):
+            # written by another parser version, never valid again
+            os.remove(entry.path)
+            continue
+        if suffix == SUFFIX:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    # drop the least recently used entries until the cache fits
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        remove(path)
+        total -= size
+
+
+def chat_meta(size, head, data, chat_format, df):
+    # the last message that starts on its own line is parsed again when the
+    # chat is extended, it and the rows after it must come out unchanged
+    tail_offset = preprocessor.last_boundary(data, chat_format)
+    tail_rows = sum(1 for _ in chat_format.pattern.finditer(data, tail_offset))
+    return {
+        'size': size,
+        'head': head,
+        'strptime': chat_format.strptime,
+        'tail_offset': tail_offset,
+        'tail_rows': min(tail_rows, df.shape[0]),
+    }
+
+
+def cached_metas(cache_dir=CACHE_DIR):
+    # (key, meta) of every cached chat of this parser version
+    suffix = f"-v{preprocessor.PARSER_VERSION}{META_SUFFIX}"
+    found = []
+    try:
+        entries = os.scandir(cache_dir)
+    except OSError:
+        return found
+    for entry in entries:
+        if not entry.name.endswith(suffix):
+            continue
+        try:
+            with open(entry.path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        found.append((entry.name[:-len(suffix)], meta))
+    return found
+
+
+def find_prefix(bytes_data, cache_dir=CACHE_DIR):
+    # the largest cached chat whose upload is a prefix of this one
+    best = None
+    for key, meta in cached_metas(cache_dir):
+        size = meta['size']
+        if size >= len(bytes_data) or (best is not None and size <= best[1]['size']):
+            continue
+        if chat_hash(bytes_data[:min(size, HEAD_BYTES)]) != meta['head']:
+            continue
+        if chat_hash(bytes_data[:size]) == key:
+            best = (key, meta)
+    return best
+
+
+def find_streamed_prefix(digest, metas):
+    # find_prefix for a stream, from the hashes the digest took at the cached sizes
+    best = None
+    for key, meta in metas:
+        size = meta['size']
+        if size >= digest.size or (best is not None and size <= best[1]['size']):
+            continue
+        if digest.prefixes.get(size) == key:
+            best = (key, meta)
+    return best
+
+
+@profiled
+def extend(old_df, meta, data, chat_format):
+    # parse from the old chat's last line-starting message, check that the
+    # overlapping rows match and append only what is new
+    if chat_format.strptime != meta['strptime']:
+        return None
+    tail = preprocessor.add_columns(preprocessor.parse_messages(data[meta['tail_offset']:], chat_format))
+    overlap = meta['tail_rows']
+    columns = ['date', 'user', 'message']
+    old_rows = old_df[columns].iloc[old_df.shape[0] - overlap:].reset_index(drop=True)
+    if tail.shape[0] < overlap or not old_rows.equals(tail[columns].iloc[:overlap].reset_index(drop=True)):
+        return None
+
+    tail = tail.iloc[overlap:].reset_index(drop=True)
+    df = pd.concat([old_df, tail], ignore_index=True)
+    analytics.extend_frame(old_df, df, tail)
+    return df
+
+
+@profiled
+def preprocess(bytes_data, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, key=None):
+    if key is None:
+        key = chat_hash(bytes_data)
+    df = load(key, cache_dir)
+    if df is not None:
+        return df
+
+    with stage('decode'):
+        data = bytes_data.decode("utf-8")
+    prefix = find_prefix(bytes_data, cache_dir)
+    return parse(key, data, len(bytes_data), chat_hash(bytes_data[:HEAD_BYTES]), prefix, cache_dir, max_bytes)
+
+
+@profiled
+def preprocess_stream(stream, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # the stream is hashed while it is decoded, so only the text is ever held;
+    # returns that hash with the frame
+    metas = cached_metas(cache_dir)
+    digest = StreamDigest([meta['size'] for _, meta in metas] + [HEAD_BYTES])
+    with stage('decode'):
+        data, _ = exports.read_text(stream, digest.update)
+
+    key = digest.hexdigest()
+    df = load(key, cache_dir)
+    if df is None:
+        prefix = find_streamed_prefix(digest, metas)
+        df = parse(key, data, digest.size, digest.head(), prefix, cache_dir, max_bytes)
+    return key, df
+
+
+def parse(key, data, size, head, prefix, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    with stage('sniff_format'):
+        chat_format = sniff_format(data)
+
+    # a newer export of a chat seen before only needs its new messages parsed
+    df = None
+    if prefix is not None:
+        old_df = load(prefix[0], cache_dir)
+        if old_df is not None:
+            df = extend(old_df, prefix[1], data, chat_format)
+
+    if df is None:
+        df = preprocessor.preprocess(data, chat_format=chat_format)
+    store(key, df, chat_meta(size, head, data, chat_format, df), cache_dir, max_bytes)
+    return df
+
+
+def upload_key(file):
+    # a zipped export is told apart by the checksum and size of its chat text
+    # in the archive directory, so its media is never hashed on a rerun
+    if zipfile.is_zipfile(file):
+        with zipfile.ZipFile(file) as archive:
+            info = exports.chat_member(archive)
+        return f"zip-{info.CRC:08x}-{info.file_size}"
+    return chat_hash(file.getvalue())
+
+
+def preprocess_upload(file, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # plain text uploads keep the hash-first lookup, zipped ones are streamed;
+    # returns the sha256 of the chat text with the frame, the key the chat
+    # store files it under whether it came as text or in an archive
+    if not zipfile.is_zipfile(file):
+        bytes_data = file.getvalue()
+        key = chat_hash(bytes_data)
+        return key, preprocess(bytes_data, cache_dir, max_bytes, key)
+    with exports.open_chat(file) as stream:
+        return preprocess_stream(stream, cache_dir, max_bytes)
@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+import calendar
+import os
+import sqlite3
+
+import pandas as pd
+
+import analytics
+import preprocessor
+
+# every chat added to the store lives in one SQLite file, the helpers run on
+# it as aggregate queries instead of loading the frames
+STORE_PATH = os.environ.get(
+    'CHAT_STORE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'whatsapp_chat_analysis', 'chats.sqlite'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    name TEXT,
+    messages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat INTEGER NOT NULL REFERENCES chats (id),
+    date TEXT,
+    user TEXT NOT NULL,
+    message TEXT NOT NULL,
+    words INTEGER NOT NULL,
+    media INTEGER NOT NULL,
+    links INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_chat_date ON messages (chat, date);
+CREATE INDEX IF NOT EXISTS messages_user_chat ON messages (user, chat);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+"""
+
+# sqlite's strftime('%w') counts from Sunday
+WEEKDAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+def connect(path=STORE_PATH):
+    if path != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # batch workers write to the same file, wait for each other's transactions
+    conn = sqlite3.connect(path, timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def ingest(conn, key, name, df):
+    # a chat added again under the same key replaces its earlier rows
+    counts = analytics.message_counts(df)
+    dates = df['date'].dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+    dates = dates.where(df['date'].notna(), None)
+    with conn:
+        conn.execute("DELETE FROM messages WHERE chat IN (SELECT id FROM chats WHERE key = ?)", (key,))
+        conn.execute("DELETE FROM chats WHERE key = ?", (key,))
+        chat = conn.execute("INSERT INTO chats (key, name, messages) VALUES (?, ?, ?)",
+                            (key, name, df.shape[0])).lastrowid
+        conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", zip(
+            [chat] * df.shape[0], dates, df['user'], df['message'],
+            counts['words'].tolist(), counts['media'].astype(int).tolist(), counts['links'].tolist()))
+    return chat
+
+
+@dataclass
+class ChatSelection:
+    # what the helpers take instead of a frame to query the store
+    conn: sqlite3.Connection
+    # chat ids to query, None for every stored chat
+    chats: tuple = None
+
+
+def where(selection, selected_user='Overall'):
+    clauses, params = [], []
+    if selection.chats is not None:
+        clauses.append(f"chat IN ({', '.join('?' * len(selection.chats))})")
+        params.extend(selection.chats)
+    if selected_user != 'Overall':
+        clauses.append("user = ?")
+        params.append(selected_user)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def query(selection, sql, selected_user='Overall'):
+    clause, params = where(selection, selected_user)
+    return selection.conn.execute(sql.format(where=clause), params).fetchall()
+
+
+def stored_chats(conn):
+    return pd.read_sql_query(
+        "SELECT chats.id, chats.key, chats.name, chats.messages, MIN(date) AS first_message, "
+        "MAX(date) AS last_message FROM chats LEFT JOIN messages ON messages.chat = chats.id "
+        "GROUP BY chats.id ORDER BY chats.id", conn)
+
+
+def user_activity(selection, user):
+    # one user's totals in every selected chat, from the (user, chat) index
+    clause, params = where(selection, user)
+    return pd.read_sql_query(
+        "SELECT chats.id AS chat, chats.name, COUNT(*) AS messages, SUM(words) AS words, "
+        "SUM(media) AS media, SUM(links) AS links, MIN(date) AS first_message, MAX(date) AS last_message "
+        f"FROM messages JOIN chats ON chats.id = messages.chat{clause} "
+        "GROUP BY chats.id ORDER BY messages DESC", selection.conn, params=params)
+
+
+# the helpers below return what their helper.py namesakes return for the
+# concatenation of the selected chats
+
+
+def fetch_stats(selected_user, selection):
+    rows = query(selection, "SELECT COUNT(*), TOTAL(words), TOTAL(media), TOTAL(links) FROM messages{where}",
+                 selected_user)
+    return tuple(int(value) for value in rows[0])
+
+
+def most_busy_users(selection):
+    # ties keep the order the users first appear in, as value_counts does
+    rows = query(selection, "SELECT user, COUNT(*) FROM messages{where} GROUP BY user "
+                            "ORDER BY COUNT(*) DESC, MIN(rowid)")
+    counts = pd.Series([count for _, count in rows], index=pd.Index([user for user, _ in rows], name='user'),
+                       name='count', dtype='int64')
+    x = counts.head()
+    df = round((counts / counts.sum()) * 100, 2).reset_index().rename(
+        columns={'index': 'name', 'user': 'percent'})
+    return x, df
+
+
+def monthly_timeline(selected_user, selection):
+    rows = query(selection, "SELECT CAST(strftime('%Y', date) AS INTEGER) AS year, "
+                            "CAST(strftime('%m', date) AS INTEGER) AS month_num, COUNT(*) FROM messages{where} "
+                            "GROUP BY year, month_num HAVING year IS NOT NULL ORDER BY year, month_num",
+                 selected_user)
+    timeline = pd.DataFrame(rows, columns=['year', 'month_num', 'message'])
+    timeline = timeline.astype({'year': 'int32', 'month_num': 'int32', 'message': 'int64'})
+    # object column, an empty selection still gives the str concatenation below
+    timeline.insert(2, 'month', pd.Series([calendar.month_name[month] for month in timeline['month_num']],
+                                          index=timeline.index, dtype=object))
+    timeline['time'] = timeline['month'] + "-" + timeline['year'].astype(str)
+    return timeline
+
+
+def daily_timeline(selected_user, selection):
+    rows = query(selection, "SELECT date(date) AS only_date, COUNT(*) FROM messages{where} "
+                            "GROUP BY only_date HAVING only_date IS NOT NULL ORDER BY only_date", selected_user)
+    timeline = pd.DataFrame(rows, columns=['only_date', 'message']).astype({'message': 'int64'})
+    timeline['only_date'] = pd.to_datetime(timeline['only_date']).dt.date
+    return timeline
+
+
+def activity_counts(selected_user, selection, part, names):
+    # message counts per strftime part, busiest first and ties in order of
+    # first appearance like the frame helpers
+    rows = query(selection, f"SELECT CAST(strftime('{part}', date) AS INTEGER) AS part, COUNT(*) "
+                            "FROM messages{where} GROUP BY part HAVING part IS NOT NULL "
+                            "ORDER BY COUNT(*) DESC, MIN(rowid)", selected_user)
+    return pd.Series([count for _, count in rows], index=[names[part] for part, _ in rows],
+                     name='count', dtype='int64')
+
+
+def week_activity_map(selected_user, selection):
+    return activity_counts(selected_user, selection, '%w', WEEKDAYS).rename_axis('day_name')
+
+
+def month_activity_map(selected_user, selection):
+    return activity_counts(selected_user, selection, '%m', calendar.month_name).rename_axis('month')
+
+
+def activity_heatmap(selected_user, selection):
+    rows = query(selection, "SELECT CAST(strftime('%w', date) AS INTEGER) AS weekday, "
+                            "CAST(strftime('%H', date) AS INTEGER) AS hour, COUNT(*) FROM messages{where} "
+                            "GROUP BY weekday, hour HAVING weekday IS NOT NULL", selected_user)
+    buckets = pd.DataFrame(rows, columns=['weekday', 'hour', 'count'])
+    buckets['day_name'] = [WEEKDAYS[day] for day in buckets['weekday']]
+    buckets['period'] = preprocessor.PERIODS[buckets['hour'].to_numpy(dtype=int)]
+    return buckets.pivot_table(index='day_name', columns='period', values='count', aggfunc='sum').fillna(0)
@@ -0,0 +1,109 @@
+from collections import Counter
+import re
+
+import emoji
+import pandas as pd
+
+from profiling import profiled
+
+# messages handed to the run pattern in one joined string
+CHUNK_SIZE = 10000
+
+_matcher = None
+
+
+def char_class(chars, gap=16):
+    # nearby codepoints collapse into ranges, a class of single characters is
+    # far slower to search and the extra characters never survive the trie
+    ranges = []
+    for code in sorted(ord(char) for char in chars):
+        if ranges and code <= ranges[-1][1] + gap:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return '[' + ''.join(
+        re.escape(chr(low)) + ('-' + re.escape(chr(high)) if high > low else '') for low, high in ranges) + ']'
+
+
+def build_matcher():
+    # codepoint trie of every EMOJI_DATA sequence, plus a pattern for runs of
+    # codepoints that occur in any sequence, built once
+    trie = {}
+    for sequence in emoji.EMOJI_DATA:
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[''] = True
+    chars = {char for sequence in emoji.EMOJI_DATA for char in sequence}
+    return trie, re.compile(char_class(chars) + '+')
+
+
+def find_emojis(run, trie):
+    # longest match at every position, so ZWJ sequences, flags and skin tones
+    # come out whole instead of as separate codepoints
+    found = []
+    pos = 0
+    size = len(run)
+    while pos < size:
+        node = trie
+        end = None
+        i = pos
+        while i < size and run[i] in node:
+            node = node[run[i]]
+            i += 1
+            if '' in node:
+                end = i
+        if end is None:
+            pos += 1
+        else:
+            found.append(run[pos:end])
+            pos = end
+    return found
+
+
+def matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = build_matcher()
+    return _matcher
+
+
+def emoji_candidates(messages):
+    # every emoji holds a non-ASCII codepoint, plain ASCII messages are skipped
+    return messages[messages.str.contains(r'[^\x00-\x7f]', regex=True)]
+
+
+def emojis_per_message(messages):
+    # emoji in every candidate message, indexed like messages; each distinct
+    # run is split into emoji once
+    trie, run_pattern = matcher()
+    candidates = emoji_candidates(messages)
+    sizes = {}
+    counts = []
+    for message in candidates:
+        total = 0
+        for run in run_pattern.findall(message):
+            if run not in sizes:
+                sizes[run] = 0 if run.isascii() else len(find_emojis(run, trie))
+            total += sizes[run]
+        counts.append(total)
+    return pd.Series(counts, index=candidates.index, dtype='int64')
+
+
+@profiled
+def count_emojis(messages):
+    trie, run_pattern = matcher()
+    candidates = emoji_candidates(messages).tolist()
+    # count whole runs in bulk over joined chunks ('\n' never occurs in a run),
+    # then split each distinct run into emoji once
+    runs = Counter()
+    for i in range(0, len(candidates), CHUNK_SIZE):
+        runs.update(run_pattern.findall('\n'.join(candidates[i:i + CHUNK_SIZE])))
+
+    counts = Counter()
+    for run, count in runs.items():
+        if run.isascii():
+            continue
+        for found in find_emojis(run, trie):
+            counts[found] += count
+    return counts
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+import codecs
+import os
+import zipfile
+
+# the chat text inside WhatsApp's "export with media" archives
+CHAT_MEMBER = '_chat.txt'
+
+# bytes decoded at a time
+READ_BYTES = 1024 * 1024
+
+
+def chat_member(archive):
+    # _chat.txt, or the only text file of archives that name it after the chat
+    texts = [info for info in archive.infolist()
+             if not info.is_dir() and info.filename.lower().endswith('.txt')]
+    for info in texts:
+        if os.path.basename(info.filename) == CHAT_MEMBER:
+            return info
+    if len(texts) == 1:
+        return texts[0]
+    raise ValueError(f"no chat text ({CHAT_MEMBER}) in the archive")
+
+
+@contextmanager
+def open_chat(file):
+    # binary stream of the chat text of a plain export or of a zipped one,
+    # the media of a zipped export is never read; file is a path or a
+    # seekable binary file
+    if zipfile.is_zipfile(file):
+        with zipfile.ZipFile(file) as archive, archive.open(chat_member(archive)) as stream:
+            yield stream
+    elif isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as stream:
+            yield stream
+    else:
+        file.seek(0)
+        yield file
+
+
+def read_text(stream, on_chunk=None, read_bytes=READ_BYTES):
+    # decoded chunk by chunk, the raw bytes are never held in full next to
+    # the text; on_chunk sees every chunk of bytes before it is dropped
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parts = []
+    size = 0
+    while True:
+        chunk = stream.read(read_bytes)
+        if not chunk:
+            break
+        if on_chunk is not None:
+            on_chunk(chunk)
+        size += len(chunk)
+        parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts), size
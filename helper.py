@@ -1,141 +1,287 @@
-from urlextract import URLExtract
-from wordcloud import WordCloud
-import pandas as pd
 from collections import Counter
-import emoji
-
-extract = URLExtract()
-
-def fetch_stats(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+import re
 
-    # fetch the number of messages
-    num_messages = df.shape[0]
-
-    # fetch the total number of words
-    words = []
-    for message in df['message']:
-        words.extend(message.split())
+from wordcloud import WordCloud
+import numpy as np
+import pandas as pd
 
-    # fetch number of media messages
-    num_media_messages = df[df['message'].str.contains('<Media omitted>', na=False)].shape[0]
+from analytics import chat_summary, conversation, message_counts, range_days, range_totals
+import chat_store
+from chat_store import ChatSelection
+import emoji_matcher
+from profiling import profiled
 
-    # fetch number of links shared
-    links = []
-    for message in df['message']:
-        links.extend(extract.find_urls(message))
 
-    return num_messages, len(words), num_media_messages, len(links)
+@profiled
+def fetch_stats(selected_user, df, date_range=None):
+    if isinstance(df, ChatSelection):
+        # a selection of stored chats is answered by the store's queries
+        return chat_store.fetch_stats(selected_user, df)
+    # date_range is an inclusive (start, end) pair of dates, answered from the
+    # time index without touching the messages
+    if date_range is not None:
+        totals = range_totals(selected_user, df, *date_range)
+        return totals['messages'], totals['words'], totals['media'], totals['links']
+    summary = chat_summary(selected_user, df, 'counts', 'links')
+    return summary.num_messages, summary.num_words, summary.num_media_messages, summary.num_links
 
 
+@profiled
 def most_busy_users(df):
+    if isinstance(df, ChatSelection):
+        return chat_store.most_busy_users(df)
     x = df['user'].value_counts().head()
     df = round((df['user'].value_counts() / df.shape[0]) * 100, 2).reset_index().rename(
         columns={'index': 'name', 'user': 'percent'})
     return x, df
 
 
-def create_wordcloud(selected_user, df):
-    try:
-        f = open('stop_hinglish.txt', 'r')
-        stop_words = f.read()
-    except FileNotFoundError:
-        stop_words = ""
-
+@profiled
+def user_leaderboard(df):
+    # every participant's totals from one grouped pass over per-message
+    # counts, instead of fetch_stats once per user
+    mask = (df['user'] != 'group_notification').to_numpy()
+    rows = df[mask]
+    counts = message_counts(df)[mask].assign(
+        user=rows['user'],
+        emojis=emoji_matcher.emojis_per_message(rows['message']).reindex(rows.index, fill_value=0),
+        only_date=rows['only_date'],
+        date=rows['date'],
+    )
+    leaderboard = counts.groupby('user', sort=False).agg(
+        messages=('date', 'size'),
+        words=('words', 'sum'),
+        media=('media', 'sum'),
+        links=('links', 'sum'),
+        emojis=('emojis', 'sum'),
+        active_days=('only_date', 'nunique'),
+        first_message=('date', 'min'),
+        last_message=('date', 'max'),
+    )
+    return leaderboard.sort_values('messages', ascending=False, kind='stable').reset_index()
+
+
+@profiled
+def reply_times(selected_user, df):
+    # a reply is a message right after one from someone else, its latency the
+    # time between the two; one pass of array comparisons over the chat
+    rows = conversation(df)
+    codes, names = pd.factorize(rows['user'])
+    dates = rows['date'].to_numpy()
+    turn = codes[1:] != codes[:-1]
+    replies = pd.DataFrame({
+        'user': codes[1:][turn],
+        'replying_to': codes[:-1][turn],
+        'minutes': (dates[1:] - dates[:-1])[turn] / np.timedelta64(1, 'm'),
+    })
     if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>\n']
-
-    def remove_stop_words(message):
-        y = []
-        for word in message.lower().split():
-            if word not in stop_words:
-                y.append(word)
-        return " ".join(y)
+        code = names.get_indexer([selected_user])[0]
+        replies = replies[(replies['user'] == code) | (replies['replying_to'] == code)]
+    latency = replies.groupby(['user', 'replying_to'], sort=False)['minutes'].agg(
+        replies='size', median_minutes='median').reset_index()
+    latency['user'] = names.take(latency['user'])
+    latency['replying_to'] = names.take(latency['replying_to'])
+    return latency.sort_values('replies', ascending=False, kind='stable').reset_index(drop=True)
+
+
+# silence that ends a conversation session
+SESSION_GAP_MINUTES = 60
+
+
+def session_members(df, gap_minutes):
+    # first and last messages of the sessions and the distinct (session, user) pairs,
+    # a new session starts after more than gap_minutes without messages
+    rows = conversation(df)
+    codes, names = pd.factorize(rows['user'])
+    dates = rows['date'].to_numpy()
+    starts = np.ones(dates.shape[0], dtype=bool)
+    starts[1:] = np.diff(dates) > np.timedelta64(gap_minutes, 'm')
+    ends = np.zeros_like(starts)
+    ends[:-1] = starts[1:]
+    ends[-1:] = True
+    sessions = np.cumsum(starts) - 1
+    members = pd.DataFrame({'session': sessions, 'user': codes}).drop_duplicates()
+    return rows, codes, names, starts, ends, members
+
+
+@profiled
+def conversation_sessions(selected_user, df, gap_minutes=SESSION_GAP_MINUTES):
+    rows, codes, names, starts, ends, members = session_members(df, gap_minutes)
+    first = np.flatnonzero(starts)
+    last = np.flatnonzero(ends)
+    dates = rows['date'].to_numpy()
+    sessions = pd.DataFrame({
+        'start': dates[first],
+        'end': dates[last],
+        'minutes': (dates[last] - dates[first]) / np.timedelta64(1, 'm'),
+        'messages': last - first + 1,
+        'participants': np.bincount(members['session'], minlength=first.shape[0]),
+        'starter': names.take(codes[first]),
+        'ender': names.take(codes[last]),
+    })
+    if selected_user != 'Overall':
+        code = names.get_indexer([selected_user])[0]
+        sessions = sessions.iloc[members.loc[members['user'] == code, 'session']].reset_index(drop=True)
+    return sessions
+
+
+@profiled
+def session_initiators(selected_user, df, gap_minutes=SESSION_GAP_MINUTES):
+    # sessions every user took part in, started and ended
+    rows, codes, names, starts, ends, members = session_members(df, gap_minutes)
+    users = len(names)
+    initiators = pd.DataFrame({
+        'user': names,
+        'sessions': np.bincount(members['user'], minlength=users),
+        'started': np.bincount(codes[starts], minlength=users),
+        'ended': np.bincount(codes[ends], minlength=users),
+    })
+    if selected_user != 'Overall':
+        initiators = initiators[initiators['user'] == selected_user]
+    return initiators.sort_values('started', ascending=False, kind='stable').reset_index(drop=True)
+
+
+# words the cloud draws at most, only these reach the layout step
+WORDCLOUD_MAX_WORDS = 200
+wordcloud_pattern = re.compile(r"\w[\w']*")
+
+
+def wordcloud_frequencies(word_counts, wc, max_words=WORDCLOUD_MAX_WORDS):
+    # what WordCloud.generate would count, worked out once per distinct word
+    # instead of over the whole chat joined into one string; two-word
+    # collocations need the running text and are left out
+    stopwords = {word.lower() for word in wc.stopwords}
+    counts = Counter()
+    for token, count in word_counts.items():
+        for word in wordcloud_pattern.findall(token):
+            if word.endswith("'s"):
+                word = word[:-2]
+            if not word.isdigit() and word not in stopwords:
+                counts[word] += count
+    # plurals fold into their singular when both occur
+    for word in list(counts):
+        if word.endswith('s') and not word.endswith('ss') and word[:-1] in counts:
+            counts[word[:-1]] += counts.pop(word)
+    return dict(counts.most_common(max_words))
+
+
+@profiled
+def create_wordcloud(selected_user, df):
+    word_counts = chat_summary(selected_user, df, 'words').word_counts
 
     wc = WordCloud(width=500, height=500, min_font_size=10, background_color='white')
-    temp['message'] = temp['message'].apply(remove_stop_words)
-    df_wc = wc.generate(temp['message'].str.cat(sep=" "))
+    df_wc = wc.generate_from_frequencies(wordcloud_frequencies(word_counts, wc))
     return df_wc
 
 
+@profiled
 def most_common_words(selected_user, df):
-    f = open('stop_hinglish.txt', 'r')
-    stop_words = f.read()
+    most_common_df = pd.DataFrame(chat_summary(selected_user, df, 'words').word_counts.most_common(20))
+    return most_common_df
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>\n']
+@profiled
+def emoji_helper(selected_user, df):
+    emoji_counts = chat_summary(selected_user, df, 'emojis').emoji_counts
+    emoji_df = pd.DataFrame(emoji_counts.most_common(len(emoji_counts)))
+    return emoji_df
 
-    words = []
-    for message in temp['message']:
-        for word in message.lower().split():
-            if word not in stop_words:
-                words.append(word)
 
-    most_common_df = pd.DataFrame(Counter(words).most_common(20))
-    return most_common_df
+@profiled
+def monthly_timeline(selected_user, df, date_range=None):
+    if isinstance(df, ChatSelection):
+        return chat_store.monthly_timeline(selected_user, df)
+    if date_range is not None:
+        days, counts = range_days(selected_user, df, *date_range)
+        dates = pd.DatetimeIndex(days)
+        timeline = pd.DataFrame({
+            'year': dates.year, 'month_num': dates.month, 'month': dates.month_name(), 'message': counts,
+        }).groupby(['year', 'month_num', 'month'])['message'].sum().reset_index()
+        timeline['time'] = timeline['month'] + "-" + timeline['year'].astype(str)
+        return timeline
 
+    buckets = chat_summary(selected_user, df, 'buckets').time_buckets
 
-def emoji_helper(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    timeline = buckets.groupby(['year', 'month_num', 'month'])['count'].sum().reset_index()
+    timeline.rename(columns={'count': 'message'}, inplace=True)
 
-    emojis = []
-    for message in df['message']:
-        emojis.extend([c for c in message if c in emoji.EMOJI_DATA])
+    timeline['time'] = timeline['month'] + "-" + timeline['year'].astype(str)
 
-    emoji_df = pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))))
-    return emoji_df
+    return timeline
 
 
-def monthly_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+@profiled
+def daily_timeline(selected_user, df, date_range=None):
+    if isinstance(df, ChatSelection):
+        return chat_store.daily_timeline(selected_user, df)
+    if date_range is not None:
+        days, counts = range_days(selected_user, df, *date_range)
+        return pd.DataFrame({'only_date': days.astype(object), 'message': counts})
 
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
+    buckets = chat_summary(selected_user, df, 'buckets').time_buckets
 
-    time = []
-    for i in range(timeline.shape[0]):
-        time.append(timeline['month'][i] + "-" + str(timeline['year'][i]))
+    daily_timeline = buckets.groupby('only_date')['count'].sum().reset_index()
+    daily_timeline.rename(columns={'count': 'message'}, inplace=True)
 
-    timeline['time'] = time
+    return daily_timeline
 
-    return timeline
 
+# most points the plotted daily timeline keeps, multi-year chats have thousands of days
+DAILY_POINT_BUDGET = 500
 
-def daily_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    daily_timeline = df.groupby('only_date').count()['message'].reset_index()
+def min_max_downsample(timeline, column, budget):
+    # the first and last rows plus the lowest and highest row of every bucket,
+    # in order, so peaks and dips survive while at most budget rows are left
+    size = timeline.shape[0]
+    if size <= budget:
+        return timeline
+    if budget < 4:
+        # too few rows for the endpoints and one low/high pair, keep evenly spaced rows
+        positions = np.linspace(0, size - 1, max(0, budget)).round().astype(int)
+        return timeline.iloc[positions].reset_index(drop=True)
+    values = timeline[column].to_numpy()
+    edges = np.linspace(1, size - 1, max(1, (budget - 2) // 2) + 1).astype(int)
+    positions = [0]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            low = start + values[start:end].argmin()
+            high = start + values[start:end].argmax()
+            positions.extend(sorted({low, high}))
+    positions.append(size - 1)
+    return timeline.iloc[positions].reset_index(drop=True)
 
-    return daily_timeline
 
+@profiled
+def daily_timeline_sampled(selected_user, df, budget=DAILY_POINT_BUDGET, date_range=None):
+    # daily_timeline is the full resolution version
+    return min_max_downsample(daily_timeline(selected_user, df, date_range), 'message', budget)
 
+
+@profiled
 def week_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, ChatSelection):
+        return chat_store.week_activity_map(selected_user, df)
+    buckets = chat_summary(selected_user, df, 'buckets').time_buckets
 
-    return df['day_name'].value_counts()
+    return buckets.groupby('day_name', sort=False)['count'].sum().sort_values(ascending=False, kind='stable')
 
 
+@profiled
 def month_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, ChatSelection):
+        return chat_store.month_activity_map(selected_user, df)
+    buckets = chat_summary(selected_user, df, 'buckets').time_buckets
 
-    return df['month'].value_counts()
+    return buckets.groupby('month', sort=False)['count'].sum().sort_values(ascending=False, kind='stable')
 
 
+@profiled
 def activity_heatmap(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, ChatSelection):
+        return chat_store.activity_heatmap(selected_user, df)
+    buckets = chat_summary(selected_user, df, 'buckets').time_buckets
 
-    user_heatmap = df.pivot_table(index='day_name', columns='period', values='message', aggfunc='count').fillna(0)
+    user_heatmap = buckets.pivot_table(index='day_name', columns='period', values='count', aggfunc='sum').fillna(0)
 
-    return user_heatmap
\ No newline at end of file
+    return user_heatmap
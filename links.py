@@ -0,0 +1,44 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import pandas as pd
+from urlextract import URLExtract
+
+from profiling import profiled
+
+extract = URLExtract()
+
+# below this many candidate messages a process pool costs more than it saves
+PARALLEL_THRESHOLD = 20000
+CHUNK_SIZE = 5000
+# cap on the pool size, set by callers that already run one chat per process
+MAX_WORKERS = None
+
+
+def url_candidates(messages):
+    # URLExtract only reports hosts ending in a dotted TLD or 'localhost',
+    # so a message with neither can never hold a link
+    return messages.str.contains('.', regex=False) | messages.str.contains('localhost', case=False, regex=False)
+
+
+def count_urls(messages):
+    return [len(extract.find_urls(message)) for message in messages]
+
+
+def link_counts(messages, workers=None):
+    # links in every candidate message, indexed like messages; the rest have none
+    candidates = messages[url_candidates(messages)]
+    texts = candidates.tolist()
+    workers = workers or MAX_WORKERS or os.cpu_count() or 1
+    if len(texts) < PARALLEL_THRESHOLD or workers < 2:
+        counts = count_urls(texts)
+    else:
+        chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = [count for chunk in pool.map(count_urls, chunks) for count in chunk]
+    return pd.Series(counts, index=candidates.index, dtype='int64')
+
+
+@profiled
+def count_links(messages, workers=None):
+    return int(link_counts(messages, workers).sum())
@@ -1,33 +1,166 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
 import re
+import numpy as np
 import pandas as pd
 
-def preprocess(data):
-    pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s[APMapm]{2}\s-\s'
+from profiling import profiled, stage
+from timestamps import DEFAULT_FORMAT, parse_dates, sniff_format
 
-    messages = re.split(pattern, data)[1:]
-    dates = re.findall(pattern, data)
+# "user: message" split, the later "x: " pieces of the message are kept
+# apart so the old re.split join can be rebuilt without rescanning the tail
+sender_pattern = re.compile(r'^(.+?):\s((?:.+?:\s)*)(.*)\Z', re.DOTALL)
+separator_pattern = re.compile(r'(.+?):\s', re.DOTALL)
 
-    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
+# bump when the output of preprocess changes, cached frames of other versions are dropped
+PARSER_VERSION = 1
+
+# number of messages turned into a DataFrame at a time
+BATCH_SIZE = 50000
+
+# exports smaller than this (in characters) are parsed on one core
+PARALLEL_THRESHOLD = 32 * 1024 * 1024
+CHUNKS_PER_WORKER = 2
+
+
+def period_label(hour):
+    if hour == 23:
+        return str(hour) + "-" + str('00')
+    elif hour == 0:
+        return str('00') + "-" + str(hour + 1)
+    else:
+        return str(hour) + "-" + str(hour + 1)
+
+
+PERIODS = np.array([period_label(hour) for hour in range(24)], dtype=object)
+
+
+def iter_messages(data, chat_format=DEFAULT_FORMAT):
+    # walk the message boundaries once and yield (date, user_message) pairs,
+    # text before the first timestamp is dropped like re.split(...)[1:] did
+    start = None
+    date = None
+    for match in chat_format.pattern.finditer(data):
+        if start is not None:
+            yield date, data[start:match.start()]
+        date = match.group()
+        start = match.end()
+    if start is not None:
+        yield date, data[start:]
+
+
+def iter_batches(records, batch_size=BATCH_SIZE):
+    dates = []
+    messages = []
+    for date, message in records:
+        dates.append(date)
+        messages.append(message)
+        if len(dates) == batch_size:
+            yield dates, messages
+            dates = []
+            messages = []
+    if dates:
+        yield dates, messages
+
+
+def build_frame(dates, user_messages, chat_format=DEFAULT_FORMAT):
+    df = pd.DataFrame({'user_message': pd.Series(user_messages, dtype=str), 'message_date': dates})
     # convert message_date type
-    df['message_date'] = pd.to_datetime(df['message_date'], format='%d/%m/%y, %I:%M %p - ', errors='coerce')
+    with stage('parse_dates'):
+        df['message_date'] = parse_dates(df['message_date'], chat_format)
 
     df.rename(columns={'message_date': 'date'}, inplace=True)
 
-    users = []
-    messages = []
-    for message in df['user_message']:
-        entry = re.split('([\w\W]+?):\s', message)
-        if len(entry) > 1:  # Checks if the split was successful for user
-            users.append(entry[1])
-            messages.append(" ".join(entry[2:]))
-        else:
-            users.append('group_notification')
-            messages.append(entry[0])
-
-    df['user'] = users
+    with stage('split_senders'):
+        entry = df['user_message'].str.extract(sender_pattern)
+        has_user = entry[0].notna()  # Checks if the split was successful for user
+        messages = entry[2].where(has_user, df['user_message'])
+        # " ".join(re.split(...)[2:]) turned every later "x: " into " x "
+        more = has_user & (entry[1].str.len() > 0)
+        if more.any():
+            messages[more] = entry[1][more].str.replace(separator_pattern, r' \1 ', regex=True) + messages[more]
+
+    df['user'] = entry[0].where(has_user, 'group_notification')
     df['message'] = messages
     df.drop(columns=['user_message'], inplace=True)
+    return df
+
+
+def concat_frames(frames):
+    if not frames:
+        return build_frame([], [])
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
 
+
+@profiled
+def parse_messages(data, chat_format, batch_size=BATCH_SIZE):
+    batches = iter_batches(iter_messages(data, chat_format), batch_size)
+    return concat_frames([build_frame(dates, messages, chat_format) for dates, messages in batches])
+
+
+def parse_chunk(args):
+    return parse_messages(*args)
+
+
+def boundary_pattern(chat_format):
+    # a newline followed by a timestamp, a serial scan always starts a message
+    # right after it, so parsing from there gives the same rows
+    return re.compile(r'\n(?=' + chat_format.pattern.pattern + ')')
+
+
+def last_boundary(data, chat_format, window=64 * 1024):
+    # offset of the last message that starts on its own line, 0 if none does
+    boundary = boundary_pattern(chat_format)
+    while True:
+        start = max(len(data) - window, 0)
+        matches = list(boundary.finditer(data, start))
+        if matches:
+            return matches[-1].end()
+        if start == 0:
+            return 0
+        window *= 4
+
+
+def chunk_bounds(data, chat_format, parts):
+    # cut where a message starts on its own line, so none is split or merged
+    boundary = boundary_pattern(chat_format)
+    bounds = [0]
+    for i in range(1, parts):
+        match = boundary.search(data, max(i * len(data) // parts, bounds[-1]))
+        if match is None:
+            break
+        if match.end() > bounds[-1]:
+            bounds.append(match.end())
+    bounds.append(len(data))
+    return bounds
+
+
+@profiled
+def parse_parallel(data, chat_format, workers, batch_size=BATCH_SIZE):
+    bounds = chunk_bounds(data, chat_format, workers * CHUNKS_PER_WORKER)
+    chunks = ((data[start:end], chat_format, batch_size) for start, end in zip(bounds, bounds[1:]))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return concat_frames(list(pool.map(parse_chunk, chunks)))
+
+
+@profiled
+def preprocess(data, batch_size=BATCH_SIZE, workers=None, chat_format=None):
+    if chat_format is None:
+        with stage('sniff_format'):
+            chat_format = sniff_format(data)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(data) >= PARALLEL_THRESHOLD:
+        df = parse_parallel(data, chat_format, workers, batch_size)
+    else:
+        df = parse_messages(data, chat_format, batch_size)
+
+    return add_columns(df)
+
+
+@profiled
+def add_columns(df):
     df['only_date'] = df['date'].dt.date
     df['year'] = df['date'].dt.year
     df['month_num'] = df['date'].dt.month
@@ -37,15 +170,10 @@ def preprocess(data):
     df['hour'] = df['date'].dt.hour
     df['minute'] = df['date'].dt.minute
 
-    period = []
-    for hour in df[['day_name', 'hour']]['hour']:
-        if hour == 23:
-            period.append(str(hour) + "-" + str('00'))
-        elif hour == 0:
-            period.append(str('00') + "-" + str(hour + 1))
-        else:
-            period.append(str(hour) + "-" + str(hour + 1))
-
-    df['period'] = period
+    if df['hour'].isna().any():
+        # unparsed dates leave float hours, label them the slow way
+        df['period'] = df['hour'].map(period_label)
+    else:
+        df['period'] = PERIODS[df['hour'].to_numpy()]
 
-    return df
\ No newline at end of file
+    return df
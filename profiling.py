@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import threading
+import time
+import tracemalloc
+
+# the recorder of the current script run, stages are free when there is none
+_recorder = ContextVar('recorder', default=None)
+
+
+# recorders that asked for memory tracing and have not been stopped, and
+# whether this module turned tracemalloc on; it is turned off again once no
+# recorder needs it, whichever run started it
+_tracing_lock = threading.Lock()
+_tracing_recorders = 0
+_started_tracing = False
+
+
+class Recorder:
+    def __init__(self, trace_memory=False):
+        # one entry per stage name in first-seen order, repeated calls add up
+        self.stages = {}
+        self.trace_memory = trace_memory
+        # stages of a run may be timed on several threads at once, each
+        # thread nests its own stages
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def add(self, name, parent, wall, cpu, peak):
+        with self.lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = {
+                    'stage': name, 'parent': parent, 'calls': 0,
+                    'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_bytes': None,
+                }
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+            if peak is not None:
+                entry['peak_bytes'] = max(entry['peak_bytes'] or 0, peak)
+
+    def records(self):
+        with self.lock:
+            return list(self.stages.values())
+
+
+def start_recording(trace_memory=False):
+    # tracemalloc makes allocations several times slower, so memory is only
+    # traced on request
+    global _tracing_recorders, _started_tracing
+    stop_recording()
+    recorder = Recorder(trace_memory)
+    if trace_memory:
+        with _tracing_lock:
+            _tracing_recorders += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+    _recorder.set(recorder)
+    return recorder
+
+
+def stop_recording():
+    global _tracing_recorders, _started_tracing
+    recorder = _recorder.get()
+    _recorder.set(None)
+    with _tracing_lock:
+        if recorder is not None and recorder.trace_memory:
+            _tracing_recorders -= 1
+        if _started_tracing and _tracing_recorders <= 0:
+            tracemalloc.stop()
+            _tracing_recorders = 0
+            _started_tracing = False
+    return recorder
+
+
+@contextmanager
+def stage(name):
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+
+    stack = recorder.stack()
+    parent = stack[-1]['name'] if stack else None
+    tracing = recorder.trace_memory and tracemalloc.is_tracing()
+    frame = {'name': name, 'base': 0, 'peak': 0}
+    if tracing:
+        # the peak counter is shared, keep what the enclosing stage reached so far
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['base'] = current
+    stack.append(frame)
+
+    # thread CPU time, the app serves every session from its own thread
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        stack.pop()
+        peak = None
+        if tracing and tracemalloc.is_tracing():
+            absolute = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+            peak = absolute - frame['base']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], absolute)
+        recorder.add(name, parent, wall, cpu, peak)
+
+
+def profiled(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,83 @@
+import re
+from collections import Counter, namedtuple
+
+import pandas as pd
+
+# how much of the export is looked at to guess its timestamp layout
+SNIFF_BYTES = 64 * 1024
+
+ChatFormat = namedtuple('ChatFormat', ['pattern', 'strptime', 'twelve_hour'])
+
+# loose line-start pattern, only used on the sniffing sample
+sniff_pattern = re.compile(
+    r'^\u200e?(?P<open>\[)?\d{1,2}(?P<sep>[/.-])\d{1,2}[/.-](?P<year>\d{2,4})(?P<comma>,)?\s'
+    r'\d{1,2}:\d{2}(?P<seconds>:\d{2})?(?P<ampm>\s?[APap]\.?\s?[Mm]\.?)?'
+    r'(?(open)\]\s|\s-\s)'
+)
+
+# day and month of a timestamp, to tell dd/mm from mm/dd
+day_month_pattern = re.compile(r'(\d{1,2})\D(\d{1,2})\D')
+
+
+def build_format(bracketed, sep, year4, comma, seconds, twelve_hour, day_first):
+    date = r'\d{1,2}' + re.escape(sep) + r'\d{1,2}' + re.escape(sep) + r'\d{2,4}' + (',' if comma else '') + r'\s'
+    time = r'\d{1,2}:\d{2}'
+    if seconds:
+        time += r':\d{2}'
+    if twelve_hour:
+        time += r'\s?[APap]\.?\s?[Mm]\.?'
+    if bracketed:
+        pattern = re.compile(r'\u200e?\[' + date + time + r'\]\s')
+    else:
+        pattern = re.compile(date + time + r'\s-\s')
+
+    # the strptime format of a stamp once parse_dates has trimmed it
+    fields = ['%d', '%m'] if day_first else ['%m', '%d']
+    strptime = fields[0] + sep + fields[1] + sep + ('%Y' if year4 else '%y') + (',' if comma else '') + ' '
+    strptime += ('%I' if twelve_hour else '%H') + ':%M' + (':%S' if seconds else '') + (' %p' if twelve_hour else '')
+    return ChatFormat(pattern, strptime, twelve_hour)
+
+
+# the classic Android export: 25/12/21, 9:05 pm - user: message
+DEFAULT_FORMAT = build_format(False, '/', False, True, False, True, True)
+
+
+def sniff_format(data):
+    votes = Counter()
+    for line in data[:SNIFF_BYTES].splitlines():
+        match = sniff_pattern.match(line)
+        if match:
+            votes[(bool(match['open']), match['sep'], len(match['year']) == 4, bool(match['comma']),
+                   bool(match['seconds']), bool(match['ampm']))] += 1
+
+    if not votes:
+        return DEFAULT_FORMAT
+
+    layout = votes.most_common(1)[0][0]
+    day_first = sniff_day_first(data, build_format(*layout, True).pattern)
+    return build_format(*layout, day_first)
+
+
+def sniff_day_first(data, pattern):
+    # dd/mm unless some stamp can only be mm/dd, stop at the first stamp that decides it
+    for match in pattern.finditer(data):
+        first, second = day_month_pattern.search(match.group()).groups()
+        if int(first) > 12:
+            return True
+        if int(second) > 12:
+            return False
+    return True
+
+
+def parse_dates(stamps, chat_format=DEFAULT_FORMAT):
+    # many messages share a minute, so parse each distinct stamp once and map back
+    codes, uniques = pd.factorize(pd.Series(stamps, dtype=str))
+    uniques = pd.Series(uniques, dtype=str)
+
+    # bring every layout down to its plain strptime form
+    uniques = uniques.str.strip(' -[]\u200e').str.replace('\u202f', ' ', regex=False).str.replace('\xa0', ' ', regex=False)
+    if chat_format.twelve_hour:
+        uniques = uniques.str.replace(r'\s?([APap])\.?\s?[Mm]\.?$', r' \1M', regex=True)
+
+    dates = pd.to_datetime(uniques, format=chat_format.strptime, errors='coerce')
+    return pd.Series(dates.to_numpy().take(codes), dtype=dates.dtype)
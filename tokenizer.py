@@ -0,0 +1,82 @@
+from collections import Counter, namedtuple
+import os
+
+import numpy as np
+
+from profiling import profiled
+
+STOP_WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stop_hinglish.txt')
+
+# every kept word of a chat as ids into vocab, row i owns ids[offsets[i]:offsets[i + 1]]
+TokenStream = namedtuple('TokenStream', ['vocab', 'ids', 'offsets'])
+
+_stop_words = None
+
+
+def stop_words():
+    # read once, a set lookup per token instead of a substring search of the file
+    global _stop_words
+    if _stop_words is None:
+        try:
+            with open(STOP_WORDS_FILE, 'r') as f:
+                _stop_words = frozenset(line.strip() for line in f if line.strip())
+        except FileNotFoundError:
+            _stop_words = frozenset()
+    return _stop_words
+
+
+def is_text_message(user, message):
+    return user != 'group_notification' and message != '<Media omitted>\n'
+
+
+@profiled
+def tokenize_messages(users, messages, vocab=()):
+    stop = stop_words()
+    word_ids = {word: i for i, word in enumerate(vocab)}
+    ids = []
+    offsets = [0]
+    for user, message in zip(users, messages):
+        if is_text_message(user, message):
+            for word in message.lower().split():
+                if word not in stop:
+                    ids.append(word_ids.setdefault(word, len(word_ids)))
+        offsets.append(len(ids))
+    return TokenStream(list(word_ids), np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64))
+
+
+def extend_stream(stream, users, messages):
+    # rows appended to a chat, known words keep their ids
+    tail = tokenize_messages(users, messages, stream.vocab)
+    return TokenStream(tail.vocab, np.concatenate([stream.ids, tail.ids]),
+                       np.concatenate([stream.offsets, tail.offsets[1:] + stream.offsets[-1]]))
+
+
+def select_rows(stream, positions):
+    # ids of the given rows, in row order, without a Python loop over the rows
+    starts = stream.offsets[positions]
+    lengths = stream.offsets[positions + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return stream.ids[:0]
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return stream.ids[np.arange(total) + shifts]
+
+
+@profiled
+def word_counts(stream, ids=None):
+    # Counter in first-seen order, so most_common breaks ties like counting
+    # word by word would
+    if ids is None:
+        ids = stream.ids
+    if len(ids) == 0:
+        return Counter()
+    unique_ids, first_seen, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.argsort(first_seen)
+    return Counter({stream.vocab[unique_ids[i]]: int(counts[i]) for i in order})
+
+
+def words(stream, ids=None):
+    if ids is None:
+        ids = stream.ids
+    vocab = stream.vocab
+    return [vocab[i] for i in ids]